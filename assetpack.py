@@ -0,0 +1,207 @@
+"""
+Baked asset pack: every loaded image, scaled frame, tile (texture atlas pages whole, the frames and tiles
+as views of them) and the parsed map stored as raw RGBA
+pixel buffers plus a JSON index in a single file, so a cold start is one file read
+instead of decoding, slicing and scaling PNGs and parsing the .tmx map.
+Build (or rebuild) it with:
+    python assetpack.py
+The game falls back to loading from the asset files whenever the pack is missing or stale.
+"""
+import os
+
+if __name__ == '__main__':
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import json
+import struct
+from os.path import exists, getmtime, getsize
+from settings import *
+import support
+from support import asset_cache, add_asset, flip_frame, flipped_frames, world_sizes, MapObject
+
+PACK_MAGIC = b'PFPACK03'
+PIXEL_FORMAT = 'BGRA'  # byte order of 32 bit ARGB pixels in memory, same as convert_alpha() surfaces
+ASSETS_DIR = 'Assety do gry'
+
+
+def source_files():
+    """
+    :return: dict of every asset file -> [size, modification time], used to detect a stale pack
+    """
+    sources = {}
+    for folder, _, files in walk(ASSETS_DIR):
+        for name in files:
+            path = join(folder, name)
+            sources[path] = [getsize(path), int(getmtime(path))]
+    return sources
+
+
+def pack_settings():
+    # settings the baked (scaled) assets depend on, a pack with atlas pages is only loaded with the atlas on
+    return [SCALE, TILE_SIZE, WINDOW_WIDTH, WINDOW_HEIGHT, support.texture_atlas is not None]
+
+
+def to_tuple(value):
+    # json turns key tuples into lists, cache keys must be tuples again
+    return tuple(to_tuple(item) for item in value) if isinstance(value, list) else value
+
+
+def write_pack(path=ASSET_PACK):
+    """
+    Writes every cached image, frame list and parsed map into the pack file.
+    Other cached assets (built levels) are cheap to rebuild and are skipped
+    :param path: pack file path
+    :return: number of stored assets
+    """
+    surfaces = []  # surfaces in the order of their pixel data
+    surface_index = {}  # id(surface) -> index in surfaces
+
+    atlas = support.texture_atlas
+
+    def store(surface):
+        if id(surface) not in surface_index:
+            if atlas and atlas.owns(surface):
+                # atlas images are stored as a view of their page, the page pixels are stored once
+                parent = store(surface.get_parent())
+                surface_index[id(surface)] = len(surfaces)
+                surfaces.append((parent, surface))
+            else:
+                surface_index[id(surface)] = len(surfaces)
+                surfaces.append(surface)
+        return surface_index[id(surface)]
+
+    entries = []
+    for key, asset in asset_cache.items():
+        try:
+            json.dumps(key)
+        except TypeError:  # key made from a surface that was not loaded through the cache
+            continue
+        if isinstance(asset, pygame.Surface):
+            entries.append([key, {'surface': store(asset)}])
+        elif isinstance(asset, list) and all(isinstance(frame, pygame.Surface) for frame in asset):
+            value = {'frames': [store(frame) for frame in asset]}
+            if all(frame in flipped_frames for frame in asset):
+                value['flipped'] = [store(flipped_frames[frame]) for frame in asset]
+            entries.append([key, value])
+        elif key[0] == 'map':
+            entries.append([key, {'map': {
+                'width': asset['width'],
+                'height': asset['height'],
+                'tiles': [[store(image), pos[0], pos[1]] for image, pos in asset['tiles']],
+                'solid': asset['solid'],
+                'entities': [[obj.name, obj.x, obj.y, obj.width, obj.height] for obj in asset['entities']]
+            }}])
+
+    pixels = []
+    offset = 0
+    surface_table = []
+    for surface in surfaces:
+        if isinstance(surface, tuple):
+            parent, view = surface
+            surface_table.append({'parent': parent, 'rect': list(view.get_offset() + view.get_size())})
+            continue
+        data = pygame.image.tobytes(surface, PIXEL_FORMAT)
+        alpha = bool(surface.get_flags() & pygame.SRCALPHA)
+        surface_table.append([offset, surface.get_width(), surface.get_height(), alpha])
+        pixels.append(data)
+        offset += len(data)
+
+    # images loaded at a render scale above 1 keep their size in world units (sprite rects, physics)
+    sizes = []
+    for i, surface in enumerate(surfaces):
+        image = surface[1] if isinstance(surface, tuple) else surface
+        if image in world_sizes:
+            sizes.append([i, *world_sizes[image]])
+    index = json.dumps({
+        'settings': pack_settings(),
+        'sources': source_files(),
+        'surfaces': surface_table,
+        'world_sizes': sizes,
+        'entries': entries
+    }).encode()
+    with open(path, 'wb') as file:
+        file.write(PACK_MAGIC)
+        file.write(struct.pack('<I', len(index)))
+        file.write(index)
+        for data in pixels:
+            file.write(data)
+    return len(entries)
+
+
+def load_pack(path=ASSET_PACK):
+    """
+    Fills the asset cache from the pack file
+    :param path: pack file path
+    :return: True if the pack was loaded, False if it is missing or stale (assets load from files as before)
+    """
+    if not path or not exists(path):
+        return False
+    with open(path, 'rb') as file:
+        data = file.read()
+    if data[:len(PACK_MAGIC)] != PACK_MAGIC:
+        return False
+    index_start = len(PACK_MAGIC) + 4
+    index_size, = struct.unpack('<I', data[len(PACK_MAGIC):index_start])
+    index = json.loads(data[index_start:index_start + index_size])
+    if index['settings'] != pack_settings() or index['sources'] != source_files():
+        return False
+
+    view = memoryview(data)[index_start + index_size:]
+    display_masks = pygame.Surface((1, 1), pygame.SRCALPHA).convert_alpha().get_masks()
+    surfaces = []
+    for entry in index['surfaces']:
+        if isinstance(entry, dict):
+            surfaces.append(surfaces[entry['parent']].subsurface(entry['rect']))
+            continue
+        offset, width, height, alpha = entry
+        # surfaces use the pixels straight from the file buffer, without copying
+        surface = pygame.image.frombuffer(view[offset:offset + width * height * 4], (width, height), PIXEL_FORMAT)
+        if not alpha:
+            surface = surface.convert()
+        elif surface.get_masks() != display_masks:
+            surface = surface.convert_alpha()
+        surfaces.append(surface)
+    for i, width, height in index['world_sizes']:
+        world_sizes[surfaces[i]] = (width, height)
+
+    for key, value in index['entries']:
+        key = to_tuple(key)
+        if 'surface' in value:
+            add_asset(key, surfaces[value['surface']])
+        elif 'frames' in value:
+            frames = [surfaces[i] for i in value['frames']]
+            for i, frame in enumerate(frames):
+                if 'flipped' in value:
+                    flipped_frames[frame] = surfaces[value['flipped'][i]]
+                else:
+                    flip_frame(frame)
+            add_asset(key, frames)
+        elif 'map' in value:
+            map_data = value['map']
+            add_asset(key, {
+                'width': map_data['width'],
+                'height': map_data['height'],
+                'tiles': [(surfaces[i], (x, y)) for i, x, y in map_data['tiles']],
+                'solid': [tuple(tile) for tile in map_data['solid']],
+                'entities': [MapObject(*obj) for obj in map_data['entities']]
+            })
+    return True
+
+
+def build_pack(path=ASSET_PACK):
+    """
+    Loads the whole game from the asset files and bakes everything it loaded into the pack
+    :param path: pack file path
+    :return: number of stored assets
+    """
+    from main import Game
+    from support import invalidate_assets
+
+    invalidate_assets()
+    Game(asset_pack=None)
+    return write_pack(path)
+
+
+if __name__ == '__main__':
+    count = build_pack()
+    print(f'{ASSET_PACK}: {count} assets, {getsize(ASSET_PACK) / 1024 / 1024:.1f} MB')
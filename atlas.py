@@ -0,0 +1,157 @@
+from settings import *
+
+
+class TextureAtlas:
+    """
+    Packs small images (animation frames, map tiles) into a few big page surfaces and hands out subsurface
+    views of them, so loading scales straight into the page without a surface per frame and the sprites
+    are drawn from a handful of source textures. Images are packed bottom-left on the skyline of a page
+    (the top edge of what is packed already), where their top edge stays the lowest
+    """
+
+    def __init__(self, page_size=ATLAS_PAGE_SIZE):
+        """
+        :param page_size: width and height of a page, bigger images are not packed
+        """
+        self.page_size = page_size
+        self.pages = []
+        self.skylines = []  # page -> [x, y, width] segments of the top edge of the packed images
+        self.free = {}  # (width, height) -> [(page, x, y)] areas of released images, reused for the same size
+        self.used = 0  # pixels covered by packed images
+        self.images = 0
+
+    def reserve(self, width, height):
+        """
+        :return: subsurface of a page with the given size to draw an image into, None if it is bigger than a page
+        """
+        if width > self.page_size or height > self.page_size:
+            return None
+        spots = self.free.get((width, height))
+        if spots:
+            page, x, y = spots.pop()
+            self.used += width * height
+            self.images += 1
+            return self.pages[page].subsurface((x, y, width, height))
+        for page, skyline in enumerate(self.skylines):
+            pos = self.find(skyline, width, height)
+            if pos:
+                break
+        else:
+            page = self.add_page()
+            pos = (0, 0)
+        self.place(self.skylines[page], pos[0], pos[1] + height, width)
+        self.used += width * height
+        self.images += 1
+        return self.pages[page].subsurface((*pos, width, height))
+
+    def find(self, skyline, width, height):
+        """
+        :param skyline: [x, y, width] segments of the top edge of what is packed in a page, from the left
+        :return: (x, y) where the image lies the lowest, the leftmost of equally low ones, None if it does not fit
+        """
+        best = None
+        for i, (x, _, _) in enumerate(skyline):
+            if x + width > self.page_size:
+                break
+            # the image lies on the highest segment under it
+            y = 0
+            j = i
+            while skyline[j][0] < x + width:
+                y = max(y, skyline[j][1])
+                j += 1
+                if j == len(skyline):
+                    break
+            if y + height <= self.page_size and (best is None or y < best[1]):
+                best = (x, y)
+        return best
+
+    @staticmethod
+    def place(skyline, x, top, width):
+        # the image covers the segments under it, neighbours at the same height are merged
+        segments = [[x, top, width]]
+        for sx, sy, sw in skyline:
+            if sx < x:
+                segments.append([sx, sy, min(sw, x - sx)])
+            if sx + sw > x + width:
+                start = max(sx, x + width)
+                segments.append([start, sy, sx + sw - start])
+        segments.sort()
+        skyline[:] = segments[:1]
+        for segment in segments[1:]:
+            if segment[1] == skyline[-1][1]:
+                skyline[-1][2] += segment[2]
+            else:
+                skyline.append(segment)
+
+    def add_page(self):
+        size = (self.page_size, self.page_size)
+        if pygame.display.get_surface():
+            # the same pixel format as convert_alpha() images, needed to scale straight into the page
+            masks = pygame.Surface((1, 1), pygame.SRCALPHA).convert_alpha().get_masks()
+            self.pages.append(pygame.Surface(size, pygame.SRCALPHA, 32, masks))
+        else:
+            self.pages.append(pygame.Surface(size, pygame.SRCALPHA))
+        self.skylines.append([[0, 0, self.page_size]])
+        return len(self.pages) - 1
+
+    def insert(self, image):
+        """
+        Copies an image into the atlas
+        :return: view of the copy, the image itself if it does not fit a page
+        """
+        view = self.reserve(*image.get_size())
+        if view is None:
+            return image
+        view.blit(image, (0, 0))
+        return view
+
+    def scale(self, image, size):
+        """
+        pygame.transform.scale into the atlas
+        :return: view of the scaled image, a separate surface if it does not fit a page
+        """
+        view = self.reserve(*size)
+        if view is None:
+            return pygame.transform.scale(image, size)
+        if image.get_bitsize() == view.get_bitsize() and image.get_masks() == view.get_masks():
+            pygame.transform.scale(image, size, view)
+        else:
+            # other pixel formats (map tiles converted without alpha) cannot be scaled into the page directly
+            view.blit(pygame.transform.scale(image, size), (0, 0))
+        return view
+
+    def release(self, view):
+        """
+        Gives the area of an image back to the atlas, the next image of the same size is packed into it
+        (a reloaded asset), so the view must not be drawn anymore
+        """
+        parent = view.get_parent()
+        page = next(i for i, page in enumerate(self.pages) if page is parent)
+        width, height = view.get_size()
+        self.free.setdefault((width, height), []).append((page, *view.get_offset()))
+        self.used -= width * height
+        self.images -= 1
+
+    def owns(self, surface):
+        return surface.get_parent() is not None and any(surface.get_parent() is page for page in self.pages)
+
+    def clear(self):
+        # views handed out keep their pages alive
+        self.pages = []
+        self.skylines = []
+        self.free = {}
+        self.used = 0
+        self.images = 0
+
+    def stats(self):
+        """
+        :return: dict with the number of pages and images, the part of the pages covered by images (0-1)
+        and the memory of the pages in bytes
+        """
+        area = len(self.pages) * self.page_size ** 2
+        return {
+            'pages': len(self.pages),
+            'images': self.images,
+            'occupancy': self.used / area if area else 0,
+            'bytes': sum(page.get_width() * page.get_height() * page.get_bytesize() for page in self.pages)
+        }
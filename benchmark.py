@@ -0,0 +1,1070 @@
+"""
+Performance benchmarks for the game.
+Runs without a window (SDL dummy video driver), usage:
+    python benchmark.py collision [--width 500] [--height 200] [--enemies 200] [--frames 60]
+    python benchmark.py draw [--width 500] [--height 200] [--sprites 2000] [--frames 60]
+    python benchmark.py startup
+    python benchmark.py frames [--scenarios small,medium,large] [--frames 60] [--json report.json] [--csv report.csv]
+                               [--baseline old_report.json] [--threshold 0.2]
+    python benchmark.py parallax [--frames 60]
+    python benchmark.py projectiles [--enemies 200] [--frames 600]
+    python benchmark.py entities [--width 500] [--enemies 1000] [--frames 60]
+    python benchmark.py timers [--enemies 200] [--frames 60]
+    python benchmark.py streaming [--width 2000] [--enemies 200]
+    python benchmark.py replay [--replay session.replay] [--frames 600]
+    python benchmark.py dirty [--frames 600]
+    python benchmark.py sprites [--sprites 2000] [--frames 60]
+    python benchmark.py lowres [--frames 60]
+    python benchmark.py atlas [--frames 60]
+"""
+import os
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import random
+import time
+import pygame
+from settings import *
+from support import import_image, load_frames, asset_cache_info
+from spatial import SpatialGrid, merge_tiles
+from sprites import Sprite, Enemy
+from groups import AllSprites
+from parallax import ParallaxBackground
+
+
+class LinearIndex:
+    """
+    Old behaviour for comparison: every query returns every terrain rect
+    """
+
+    def __init__(self, rects):
+        self.rects = list(rects)
+
+    def query(self, rect):
+        return self.rects
+
+
+class CountingIndex:
+    """
+    Wraps a terrain index and counts how many rects the collision code had to test
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.tests = 0
+
+    def query(self, rect):
+        rects = self.index.query(rect)
+        self.tests += len(rects)
+        return rects
+
+
+def init_display():
+    pygame.init()
+    pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+
+
+def synthetic_tiles(width, height, seed=0):
+    """
+    Generates solid tiles for a width x height tile map:
+    two rows of floor, walls on the map edges and random floating platforms
+    :return: list of (x, y) tile coordinates, row by row
+    """
+    rng = random.Random(seed)
+    solid = set()
+    for x in range(width):
+        solid.add((x, height - 1))
+        solid.add((x, height - 2))
+    for y in range(height):
+        solid.add((0, y))
+        solid.add((width - 1, y))
+    for _ in range(width * height // 40):
+        x, y, length = rng.randrange(width), rng.randrange(height - 4), rng.randint(2, 8)
+        for i in range(length):
+            solid.add((min(x + i, width - 1), y))
+    return sorted(solid, key=lambda tile: (tile[1], tile[0]))
+
+
+def build_grid(rects):
+    grid = SpatialGrid(TILE_SIZE * SCALE)
+    for rect in rects:
+        grid.insert(rect)
+    return grid
+
+
+def spawn_enemies(count, width, height, index, animations, seed=0):
+    """
+    Spawns enemies standing on the floor, spread evenly over the map width
+    """
+    random.seed(seed)
+    size = TILE_SIZE * SCALE
+    group = pygame.sprite.Group()
+    step = (width - 2) * size / count
+    for i in range(count):
+        patrol = pygame.FRect(size + i * step, (height - 3) * size, step, size)
+        Enemy(patrol, (group,), index, group, animations, lambda pos, direction: None)
+    return group
+
+
+def run_frames(group, frames, dt=1 / FRAMERATE):
+    """
+    :return: list of frame times in milliseconds
+    """
+    times = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        group.update(dt)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def bench_collision(args):
+    """
+    Enemy update time with the terrain spatial grid vs. the old linear scan
+    over every tile, on the same map and with the same random seed
+    """
+    init_display()
+    walk = import_image('Assety do gry', 'Enemy1', 'Walk')
+    frames = load_frames(walk, 6, 128, 128, 0.6)
+    animations = {state: frames for state in ('idle', 'walk', 'jump', 'attack', 'dead')}
+
+    size = TILE_SIZE * SCALE
+    tiles = synthetic_tiles(args.width, args.height)
+    rects = [pygame.FRect(x * size, y * size, size, size) for x, y in tiles]
+    merged = [pygame.FRect(x * size, y * size, w * size, h * size) for x, y, w, h in merge_tiles(tiles)]
+    print(f'map {args.width}x{args.height} tiles, {len(rects)} solid tiles '
+          f'merged into {len(merged)} rects, {args.enemies} enemies')
+
+    results = {}
+    positions = {}
+    variants = (('linear', LinearIndex(rects)), ('grid', build_grid(rects)), ('merged', build_grid(merged)))
+    for name, index in variants:
+        index = CountingIndex(index)
+        group = spawn_enemies(args.enemies, args.width, args.height, index, animations)
+        times = run_frames(group, args.frames)
+        results[name] = sum(times) / len(times)
+        positions[name] = [tuple(enemy.hitbox) for enemy in group]
+        print(f'{name:>8}: {results[name]:8.2f} ms/frame, {index.tests // args.frames:8d} rect tests/frame')
+
+    print(f' speedup: {results["linear"] / results["grid"]:8.1f}x grid, {results["linear"] / results["merged"]:.1f}x merged')
+    for name in ('grid', 'merged'):
+        print(f'{name:>8}:', 'identical to linear' if positions['linear'] == positions[name] else 'DIFFERENT from linear')
+
+
+def bench_draw(args):
+    """
+    Map drawing time with one sprite per tile and no culling vs. tiles baked into
+    static layer chunks and culled dynamic sprites, camera sweeping along the floor of the map
+    """
+    init_display()
+    size = TILE_SIZE * SCALE
+    image = pygame.transform.scale(import_image('Assety do gry', 'Tiles', '1 Tiles', 'Tile_02'), (size, size))
+    coin = load_frames(import_image('Assety do gry', 'Money'), 6, 24, 24, 1.2)[0]
+    tiles = synthetic_tiles(args.width, args.height)
+    map_width, map_height = args.width * size, args.height * size
+    rng = random.Random(0)
+    coins = [(rng.uniform(0, map_width), rng.uniform(0, map_height)) for _ in range(args.sprites)]
+    print(f'map {args.width}x{args.height} tiles, {len(tiles)} tiles, {args.sprites} dynamic sprites')
+
+    per_tile = AllSprites(cull_margin=max(map_width, map_height))  # margin over the whole map: nothing culled
+    for x, y in tiles:
+        Sprite((x * size, y * size), image, per_tile)
+    chunked = AllSprites()
+    for x, y in tiles:
+        chunked.static_layer.add(image, (x * size, y * size))
+    for group in (per_tile, chunked):
+        for pos in coins:
+            Sprite(pos, coin, group)
+
+    results = {}
+    for name, group in (('per tile', per_tile), ('chunked', chunked)):
+        times = []
+        for frame in range(args.frames):
+            target = (map_width * frame / args.frames, map_height - 3 * size)
+            start = time.perf_counter()
+            group.draw(target, map_width, map_height)
+            times.append((time.perf_counter() - start) * 1000)
+        results[name] = sum(times) / len(times)
+        print(f'{name:>8}: {results[name]:8.2f} ms/frame ({1000 / results[name]:.0f} FPS), '
+              f'last frame blits: {group.draw_stats}')
+    print(f' speedup: {results["per tile"] / results["chunked"]:8.1f}x')
+
+
+def bench_startup(args):
+    """
+    Game start time from the asset files vs. from the baked asset pack,
+    and restart (Game.__init__ called again, assets come from the cache)
+    """
+    import tempfile
+    from main import Game
+    from assetpack import write_pack
+    from support import invalidate_assets
+
+    start = time.perf_counter()
+    game = Game(asset_pack=None)
+    files = (time.perf_counter() - start) * 1000
+    print(f'  files: {files:8.2f} ms, cache {asset_cache_info()}')
+
+    pack_path = os.path.join(tempfile.mkdtemp(), 'bench.pack')
+    write_pack(pack_path)
+    invalidate_assets()
+    start = time.perf_counter()
+    game.__init__(asset_pack=pack_path)
+    pack = (time.perf_counter() - start) * 1000
+    print(f'   pack: {pack:8.2f} ms, cache {asset_cache_info()}, {os.path.getsize(pack_path) / 1024 / 1024:.1f} MB')
+    os.remove(pack_path)
+
+    start = time.perf_counter()
+    game.__init__()
+    restart = (time.perf_counter() - start) * 1000
+    print(f'restart: {restart:8.2f} ms, cache {asset_cache_info()}')
+
+
+def legacy_background(surface, layers, scroll):
+    # old Game.scroll_background drawing: every layer 5 times in a fixed row, mostly off the screen
+    width = layers[0].get_width()
+    for x in range(5):
+        speed = 1
+        for layer in layers:
+            surface.blit(layer, ((x * width) + scroll * speed, 0))
+            speed += 0.2
+
+
+def bench_parallax(args):
+    """
+    Background drawing time of the old fixed 5 copies renderer vs. the parallax renderer
+    (visible copies only, with and without cached far layers), and a check that every scroll value
+    the old renderer covered the screen for gives exactly the same pixels. Exits with 1 on a difference
+    """
+    from main import Game
+
+    game = Game(headless=True)
+    layers, speeds = game.background.layers, game.background.speeds
+    width = layers[0].get_width()
+    # the old renderer runs out of copies of the fastest layer after this scroll
+    min_scroll = -(4 * width - WINDOW_WIDTH) / speeds[-1]
+    scrolls = [scroll for scroll in range(0, int(min_scroll), -5)] + [-1, -2, -3, -7, -333, int(min_scroll) + 1]
+    expected = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT)).convert()
+    result = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT)).convert()
+
+    renderers = {'visible only': ParallaxBackground(layers, speeds),
+                 '2 cached': ParallaxBackground(layers, speeds, 2),
+                 'all cached': ParallaxBackground(layers, speeds, len(layers))}
+    mismatches = 0
+    for name, background in renderers.items():
+        different = []
+        for scroll in scrolls:
+            legacy_background(expected, layers, scroll)
+            result.fill((255, 0, 255))
+            background.draw(result, scroll)
+            if pygame.image.tobytes(expected, 'RGB') != pygame.image.tobytes(result, 'RGB'):
+                different.append(scroll)
+        mismatches += len(different)
+        print(f'{name:>12}: {len(scrolls) - len(different)}/{len(scrolls)} scroll values pixel identical'
+              + (f', different: {different[:10]}' if different else ''))
+
+    # walking (scroll changes every frame) and standing still (same scroll every frame)
+    for motion, step in (('walking', -5), ('standing', 0)):
+        results = {}
+        for name, draw in [('old', lambda scroll: legacy_background(result, layers, scroll))] + [
+                (name, lambda scroll, background=background: background.draw(result, scroll))
+                for name, background in renderers.items()]:
+            start = time.perf_counter()
+            for frame in range(args.frames):
+                draw(frame * step)
+            results[name] = (time.perf_counter() - start) * 1000 / args.frames
+        print(f'{motion:>8}: ' + ', '.join(f'{name} {ms:.2f} ms' for name, ms in results.items()))
+    if mismatches:
+        raise SystemExit(1)
+
+
+def bench_projectiles(args):
+    """
+    Enemy projectiles created for every shot vs. taken from the projectile pool vs. pooled and moved
+    by the NumPy kinematics backend: every enemy fires once a second, projectiles fly until their timer
+    kills them. Reports frame times and the garbage collector pauses during the run, and checks that
+    the NumPy backend leaves every projectile in the same state as the per sprite updates
+    """
+    import gc
+    from main import Game
+    from pool import ProjectilePool
+    from sprites import Projectile
+    from timer import set_clock, scheduler
+    from kinematics import np
+
+    game = Game(headless=True)
+    dt = 1 / FRAMERATE
+    shots_per_frame = args.enemies * dt
+    frames = max(args.frames, 600)  # long enough for the projectile count to settle
+    print(f'{args.enemies} enemies firing once a second, {frames} frames')
+
+    pauses = []
+    gc_start = [0]
+
+    def gc_callback(phase, info):
+        if phase == 'start':
+            gc_start[0] = time.perf_counter()
+        else:
+            pauses.append((time.perf_counter() - gc_start[0]) * 1000)
+
+    results = {}
+    states = {}
+    for name in ('new', 'pool', 'numpy') if np else ('new', 'pool'):
+        ticks = [1]
+        set_clock(lambda: ticks[0])
+        group = pygame.sprite.Group()
+        # enough room for every projectile alive at once, nothing is evicted
+        pool = ProjectilePool(game.e_projectile, (group,), capacity=args.enemies * 2,
+                              kinematics='numpy' if name == 'numpy' else 'python')
+        gc.collect()
+        pauses.clear()
+        gc.callbacks.append(gc_callback)
+        times = []
+        shots = 0
+        for frame in range(frames):
+            start = time.perf_counter()
+            shots += shots_per_frame
+            while shots >= 1:
+                shots -= 1
+                pos, direction = (frame % 100 * 10, 0), 1 if frame % 2 else -1
+                if name == 'new':
+                    Projectile(game.e_projectile, pos, direction, (group,))
+                else:
+                    pool.spawn(pos, direction)
+            scheduler.update()
+            group.update(dt)
+            if pool.kinematics:
+                pool.kinematics.step(dt)
+            ticks[0] += dt * 1000
+            times.append((time.perf_counter() - start) * 1000)
+        gc.callbacks.remove(gc_callback)
+        results[name] = phase_stats(times)
+        states[name] = sorted((sprite.rect.topleft, sprite.proj_hitbox.topleft, sprite.frame_index,
+                               sprite.flip) for sprite in group)
+        print(f'{name:>5}: {results[name]["mean"]:.3f} ms/frame (max {results[name]["max"]:.3f}), '
+              f'{len(pauses)} gc runs, {sum(pauses):.2f} ms total, longest {max(pauses, default=0):.3f} ms'
+              + (f', pool {pool.stats()}' if name != 'new' else ''))
+        group.empty()
+    set_clock()
+    if np:
+        same = states['numpy'] == states['pool']
+        print('numpy:', 'same projectile states as per sprite updates' if same else 'DIFFERENT projectile states')
+        if not same:
+            raise SystemExit(1)
+
+
+def bench_entities(args):
+    """
+    Player vs entity checks (attack, damage, pickups) scanning every entity vs. querying the per step
+    entity grid, on a synthetic map with thousands of enemies, coins and hearts and the demo input script.
+    Both runs use the same random seed and must end in the same game state
+    """
+    import tempfile
+    from main import Game
+    from inputs import ScriptedInput, DEMO_SCRIPT
+    from timer import set_clock
+    from profiler import profiler
+
+    map_path = join(tempfile.mkdtemp(), 'entities.tmx')
+    write_synthetic_map(map_path, args.width, 30, args.enemies, args.enemies * 3, args.enemies // 3)
+    steps = args.frames * round(SIMULATION_RATE / FRAMERATE)
+
+    results = {}
+    states = {}
+    for name in ('linear', 'grid'):
+        random.seed(0)
+        # the whole map loaded, so the checks see every entity of the map
+        game = Game(headless=True, inputs=ScriptedInput(DEMO_SCRIPT), map_path=map_path, stream_distance=None)
+        game.entities.broad_phase = name == 'grid'
+        ticks = [1]
+        set_clock(lambda: ticks[0])
+        profiler.enabled = True
+        times = []
+        for _ in range(steps):
+            game.update_world(SIMULATION_STEP)
+            ticks[0] += SIMULATION_STEP * 1000
+            profiler.end_frame()
+            times.append(profiler.last_frame.get('collision', 0.0))
+        profiler.enabled = False
+        set_clock()
+        results[name] = phase_stats(times)
+        states[name] = (game.player.rect.topleft, game.player.health, game.score, len(game.entities))
+        print(f'{name:>6}: {len(game.entities)} entities, collision {results[name]["mean"]:.3f} ms/step '
+              f'(p95 {results[name]["p95"]:.3f})')
+    print(f'speedup: {results["linear"]["mean"] / results["grid"]["mean"]:.1f}x,',
+          'same game state' if states['linear'] == states['grid'] else 'DIFFERENT game state')
+    if states['linear'] != states['grid']:
+        raise SystemExit(1)
+
+
+def bench_timers(args):
+    """
+    Cost of a simulation step with one running cooldown timer per enemy (plus a lifetime timer
+    per projectile, 10 per enemy): polling every timer vs. the heap scheduler firing only the expiring ones
+    """
+    from timer import Timer, set_clock, scheduler
+
+    ticks = [1]
+    set_clock(lambda: ticks[0])
+    count = args.enemies * 11
+    steps = args.frames * round(SIMULATION_RATE / FRAMERATE)
+    print(f'{count} running timers, {steps} steps')
+
+    results = {}
+    for name in ('polling', 'scheduler'):
+        ticks[0] = 1
+        scheduler.clear()
+        rng = random.Random(0)
+        fired = [0]
+
+        def restart(timer):
+            fired[0] += 1
+            timer.activate()
+
+        timers = []
+        for _ in range(count):
+            timer = Timer(rng.randint(3, 25) * 100)
+            timer.func = lambda timer=timer: restart(timer)
+            timer.activate()
+            timers.append(timer)
+        start = time.perf_counter()
+        for _ in range(steps):
+            if name == 'polling':
+                for timer in timers:
+                    timer.update()
+            else:
+                scheduler.update()
+            ticks[0] += SIMULATION_STEP * 1000
+        results[name] = (time.perf_counter() - start) * 1000 / steps
+        print(f'{name:>9}: {results[name]:.3f} ms/step, {fired[0]} timers fired')
+    print(f'  speedup: {results["polling"] / results["scheduler"]:.1f}x')
+    scheduler.clear()
+    set_clock()
+
+
+def bench_streaming(args):
+    """
+    Loading a wide synthetic level whole (every chunk baked, every entity spawned) vs. streaming it around
+    the player: load time, chunk surface memory and entities in the game, then the player swept across
+    the whole level with the slowest streaming update (the hitch of loading chunks).
+    Fails if the spawn slots of the streamed level get out of sync with the loaded chunks
+    """
+    import tempfile
+    from main import Game
+    from support import invalidate_assets
+
+    map_path = join(tempfile.mkdtemp(), 'streaming.tmx')
+    write_synthetic_map(map_path, args.width, 30, args.enemies, args.enemies * 3, args.enemies // 3)
+
+    def memory(game):
+        layer = game.all_sprites.static_layer
+        registries = (game.enemy_spawns, game.heart_spawns, game.collectible_spawns)
+        size = sum(chunk.get_bytesize() * CHUNK_SIZE * CHUNK_SIZE for chunk in layer.chunks.values())
+        return len(layer.chunks), size, sum(len(registry.entities) for registry in registries)
+
+    for name, distance in (('full', None), ('stream', STREAM_DISTANCE)):
+        invalidate_assets(map_path)
+        start = time.perf_counter()
+        game = Game(map_path=map_path, stream_distance=distance)
+        layer = game.all_sprites.static_layer
+        if distance is None:
+            for key in layer.tiles:  # loading the whole level bakes every chunk up front
+                layer.bake(key)
+        load = (time.perf_counter() - start) * 1000
+        chunks, size, entities = memory(game)
+        print(f'{name:>6}: load {load:8.2f} ms, {chunks} of {len(layer.tiles)} chunks baked '
+              f'({size / 1024 / 1024:.1f} MB), {entities} entities')
+
+    streamer = game.streamer
+    y = game.player.rect.centery
+    hitch = 0
+    peak = (0, 0, 0)
+    for x in range(int(game.player.rect.centerx), game.map_width, 48):
+        start = time.perf_counter()
+        streamer.update((x, y))
+        hitch = max(hitch, (time.perf_counter() - start) * 1000)
+        peak = max(peak, memory(game))
+    print(f' sweep: slowest update {hitch:.2f} ms, at most {peak[0]} chunks baked '
+          f'({peak[1] / 1024 / 1024:.1f} MB), {peak[2]} entities')
+
+    for registry in streamer.registries:
+        expected = {slot for slot in range(len(registry)) if registry.spawned[slot] and slot not in registry.suspended}
+        loaded = {slot for key in streamer.loaded for other, slot in streamer.slots.get(key, ()) if other is registry}
+        if set(registry.entities) != expected or registry.suspended != set(range(len(registry))) - loaded:
+            print('spawn slots out of sync with the loaded chunks')
+            raise SystemExit(1)
+
+
+def bench_replay(args):
+    """
+    A recorded session (python main.py --record) as a benchmark workload: per phase step times of the replay,
+    failing if the world state stops matching the recording. Without --replay the demo input script
+    is recorded first (seed 0, --frames rendered frames worth of steps)
+    """
+    import tempfile
+    from main import Game
+    from inputs import ScriptedInput, DEMO_SCRIPT
+    from replay import Recorder, load_replay, replay_game
+    from profiler import profiler
+
+    path = args.replay
+    if not path:
+        path = join(tempfile.mkdtemp(), 'demo.replay')
+        recorder = Recorder(ScriptedInput(DEMO_SCRIPT))
+        game = Game(headless=True, seed=0, replay=recorder)
+        game.run_headless(args.frames * round(SIMULATION_RATE / FRAMERATE))
+        recorder.save(path)
+    replay = load_replay(path)
+    print(f'{path}: {replay["steps"]} steps, seed {replay["seed"]}, {os.path.getsize(path) / 1024:.1f} kB')
+
+    game, player = replay_game(replay)
+    times = {phase: [] for phase in PHASES}
+    profiler.enabled = True
+    while player.steps < replay['steps'] and not game.player_dead:
+        game.update_world(SIMULATION_STEP)
+        profiler.end_frame()
+        for phase in PHASES:
+            times[phase].append(profiler.last_frame.get(phase, 0.0))
+    profiler.enabled = False
+    for phase in ('update', 'collision', 'respawn'):
+        stats = phase_stats(times[phase])
+        print(f'{phase:>9}: {stats["mean"]:.3f} ms/step (p95 {stats["p95"]:.3f}, max {stats["max"]:.3f})')
+    if player.diverged or player.steps != replay['steps']:
+        print(f'DIVERGED at step {player.diverged or player.steps}')
+        raise SystemExit(1)
+    print(f'same world state as recorded ({len(replay["checksums"])} checksums)')
+
+
+def bench_dirty(args):
+    """
+    Pixels pushed to the window per frame, full display updates vs. dirty rects, on the world map with the demo
+    input script and then the idle game over screen. A copy of the window updated only with the pushed areas
+    must match the screen after every frame
+    """
+    from main import Game
+    from inputs import ScriptedInput, DEMO_SCRIPT
+    from gameover import GameOver
+    from timer import set_clock
+
+    window = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT))
+    pushed_rects = []
+
+    def push(rects=None):
+        screen = pygame.display.get_surface()
+        rects = [screen.get_rect()] if rects is None else rects
+        pushed_rects.extend(rects)
+        for rect in rects:
+            window.blit(screen, rect, rect)
+
+    display_update = pygame.display.update
+    pygame.display.update = push
+    game = Game(inputs=ScriptedInput(DEMO_SCRIPT), seed=0)
+    ticks = [pygame.time.get_ticks() + 1]
+    set_clock(lambda: ticks[0])
+    steps_per_frame = round(SIMULATION_RATE / FRAMERATE)
+    pixels = {'game': [], 'game over': []}
+    partial = {'game': 0, 'game over': 0}
+    mismatches = 0
+    for frame in range(args.frames * 2):
+        scene = 'game' if frame < args.frames else 'game over'
+        if scene == 'game':
+            unupdated_x = game.player.rect.x
+            for _ in range(steps_per_frame):
+                game.update_world(SIMULATION_STEP)
+                ticks[0] += SIMULATION_STEP * 1000
+            game.draw_world(unupdated_x)
+        else:
+            if not game.game_over_screen:
+                game.game_over_screen = GameOver(game.display_surface, game.score)
+            game.dirty_rects.add_all(game.game_over_screen.draw())
+        pushed_rects.clear()
+        game.dirty_rects.update()
+        pixels[scene].append(game.dirty_rects.pixels)
+        partial[scene] += game.dirty_rects.pixels < WINDOW_WIDTH * WINDOW_HEIGHT
+        if pygame.image.tobytes(window, 'RGB') != pygame.image.tobytes(game.display_surface, 'RGB'):
+            mismatches += 1
+    pygame.display.update = display_update
+    set_clock()
+
+    full = WINDOW_WIDTH * WINDOW_HEIGHT
+    for scene, values in pixels.items():
+        average = sum(values) / len(values)
+        print(f'{scene:>9}: {average:9.0f} pixels/frame pushed vs {full} full ({average / full:.1%}), '
+              f'{partial[scene]} of {len(values)} frames partial')
+    if mismatches:
+        print(f'{mismatches} frames with a window different from the screen')
+        raise SystemExit(1)
+
+
+def legacy_sprites(group, surface, raw_kick, alpha):
+    """
+    Old AllSprites.draw sprite loop for comparison: one blit per sprite, the player found by an isinstance test
+    and drawn last, the kick scaled (and flipped) every frame. Needs a group.draw call before for the camera
+    """
+    from sprites import Player
+
+    player_sprite = None
+    for sprite in group.view_rect.collideobjectsall(group.sprites()):
+        if isinstance(sprite, Player):
+            player_sprite = sprite
+        else:
+            surface.blit(sprite.image, group.offset + group.interpolate(sprite, alpha))
+    if player_sprite:
+        offset_pos = group.offset + group.interpolate(player_sprite, alpha)
+        surface.blit(player_sprite.image, offset_pos)
+        if player_sprite.attacking:
+            kick_img = pygame.transform.scale(raw_kick, (int(raw_kick.get_width() * SCALE * 0.6),
+                                                         int(raw_kick.get_height() * SCALE * 0.6)))
+            if player_sprite.flip:
+                kick_img = pygame.transform.flip(kick_img, True, False)
+                kick_rect = kick_img.get_rect(left=player_sprite.attack_hitbox.left,
+                                              centery=player_sprite.attack_hitbox.centery - 15)
+            else:
+                kick_rect = kick_img.get_rect(right=player_sprite.attack_hitbox.right,
+                                              centery=player_sprite.attack_hitbox.centery - 15)
+            surface.blit(kick_img, kick_rect.topleft + offset_pos - player_sprite.rect.topleft)
+
+
+def bench_sprites(args):
+    """
+    Drawing sprites that are all on the screen (plus a kicking player): the old one blit per sprite loop
+    vs. the render queue of AllSprites. Both must draw the same pixels, with the player facing both ways
+    """
+    from sprites import Player
+    from support import scale_image
+
+    init_display()
+    screen = pygame.display.get_surface()
+    coins = load_frames(import_image('Assety do gry', 'Money'), 6, 24, 24, 1.2)
+    idle = load_frames(import_image('Assety do gry', 'Player', 'Idle-sheet'), 4, 128, 128, 0.6)
+    raw_kick = import_image('Assety do gry', 'Player', 'KickPart')
+    kick = scale_image(raw_kick, (int(raw_kick.get_width() * SCALE * 0.6), int(raw_kick.get_height() * SCALE * 0.6)))
+
+    group = AllSprites()
+    rng = random.Random(0)
+    for i in range(args.sprites):
+        sprite = Sprite((rng.uniform(-20, WINDOW_WIDTH), rng.uniform(-20, WINDOW_HEIGHT)), coins[i % len(coins)], group)
+        sprite.previous_pos = (sprite.rect.x - rng.uniform(0, 3), sprite.rect.y + rng.uniform(0, 3))
+    player = Player((WINDOW_WIDTH / 2, WINDOW_HEIGHT / 2), group, SpatialGrid(TILE_SIZE * SCALE),
+                    pygame.sprite.Group(), {'idle': idle, 'kick': kick})
+    player.attacking = True
+    target = (WINDOW_WIDTH / 2, WINDOW_HEIGHT / 2)
+    print(f'{len(group)} sprites on the screen')
+
+    same = True
+    for flip in (False, True):
+        player.flip = flip
+        player.attack_hitbox.midright = player.hitbox.midleft
+        if not flip:
+            player.attack_hitbox.midleft = player.hitbox.midright
+        screen.fill('black')
+        group.draw(target, WINDOW_WIDTH, WINDOW_HEIGHT, 0.5)
+        queued = pygame.image.tobytes(screen, 'RGB')
+        screen.fill('black')
+        legacy_sprites(group, screen, raw_kick, 0.5)
+        same = same and queued == pygame.image.tobytes(screen, 'RGB')
+
+    def frame_time(draw):
+        start = time.perf_counter()
+        for _ in range(args.frames):
+            draw()
+        return (time.perf_counter() - start) * 1000 / args.frames
+
+    # best of 5 interleaved runs, blit times vary a lot. The per sprite overhead is measured again
+    # with 1x1 images, so the blits cost next to nothing
+    def queue_draw(track_dirty):
+        group.track_dirty = track_dirty
+        group.draw(target, WINDOW_WIDTH, WINDOW_HEIGHT, 0.5)
+
+    draws = {
+        'per sprite': lambda: legacy_sprites(group, screen, raw_kick, 0.5),
+        'queue': lambda: queue_draw(False),
+        # still camera: every frame also compares what was drawn with the last frame
+        'queue + dirty rects': lambda: queue_draw(True)
+    }
+    totals = {name: min(frame_time(draw) for _ in range(5)) for name, draw in draws.items()}
+    tiny = pygame.Surface((1, 1), pygame.SRCALPHA)
+    for sprite in group:
+        if sprite is not player:
+            sprite.image = tiny
+    results = {name: min(frame_time(draw) for _ in range(5)) for name, draw in draws.items()}
+    for name in draws:
+        print(f'{name:>19}: {totals[name]:7.3f} ms/frame, {results[name] * 1000 / len(group):.2f} us/sprite '
+              f'without the pixels')
+    print(f'speedup: {results["per sprite"] / results["queue"]:.1f}x less per sprite overhead,',
+          'same pixels' if same else 'DIFFERENT pixels')
+    if not same:
+        raise SystemExit(1)
+
+
+def surface_bytes(surfaces):
+    """
+    :param surfaces: surfaces, a surface shared by several entries is counted once
+    :return: pixel memory of the surfaces in bytes, subsurfaces (atlas images) count as the surface they are part of
+    """
+    unique = {}
+    for surface in surfaces:
+        surface = surface.get_parent() or surface
+        unique[id(surface)] = surface
+    return sum(surface.get_width() * surface.get_height() * surface.get_bytesize() for surface in unique.values())
+
+
+def cached_surfaces(asset):
+    """
+    :param asset: cached asset (surface, frame list, level with its chunked layer, ...)
+    :return: list of the surfaces in it
+    """
+    from groups import ChunkedLayer
+
+    if isinstance(asset, pygame.Surface):
+        return [asset]
+    if isinstance(asset, ChunkedLayer):
+        return [image for tiles in asset.tiles.values() for image, _ in tiles] + list(asset.chunks.values())
+    if isinstance(asset, dict):
+        return cached_surfaces(list(asset.values()))
+    if isinstance(asset, (list, tuple)):
+        return [surface for item in asset for surface in cached_surfaces(item)]
+    return []
+
+
+def texture_memory(game):
+    """
+    :return: dict with the pixel memory in bytes of the image files as loaded, the world images made
+    from them (scaled and split into frames, flipped frames, map tiles, baked chunks) and the render target
+    """
+    from support import asset_cache, flipped_frames
+
+    files = [asset for key, asset in asset_cache.items() if key[0] == 'image']
+    world = [surface for key, asset in asset_cache.items() if key[0] != 'image' for surface in cached_surfaces(asset)]
+    world += [flipped_frames[surface] for surface in world if surface in flipped_frames]
+    world += cached_surfaces(game.all_sprites.static_layer)
+    world += [image for image, _ in game.background.images] + ([game.background.cache] if game.background.cache else [])
+    target = [game.all_sprites.target] if game.all_sprites.upscaled else []
+    if game.all_sprites.upscaled:
+        target.append(game.all_sprites.upscaled)
+    return {'files': surface_bytes(files), 'world': surface_bytes(world), 'target': surface_bytes(target)}
+
+
+def bench_lowres(args):
+    """
+    The demo run at full resolution vs. the world drawn at 1/SCALE and upscaled: draw phase time and the
+    memory of the images. The simulation must end in the same state, physics stay in world units
+    """
+    from main import Game
+    from inputs import ScriptedInput, DEMO_SCRIPT
+    from timer import set_clock
+    from profiler import profiler
+    from replay import world_checksum
+    from support import invalidate_assets
+
+    checksums = {}
+    for low_res in (False, True):
+        invalidate_assets()  # the images are loaded again at the resolution of the mode
+        game = Game(inputs=ScriptedInput(DEMO_SCRIPT), seed=0, low_res=low_res)
+        ticks = [pygame.time.get_ticks() + 1]
+        set_clock(lambda: ticks[0])
+        steps_per_frame = round(SIMULATION_RATE / FRAMERATE)
+        draw_times = []
+        profiler.enabled = True
+        for _ in range(args.frames):
+            unupdated_x = game.player.rect.x
+            for _ in range(steps_per_frame):
+                game.update_world(SIMULATION_STEP)
+                ticks[0] += SIMULATION_STEP * 1000
+            game.draw_world(unupdated_x)
+            profiler.end_frame()
+            draw_times.append(profiler.last_frame.get('draw', 0.0))
+        profiler.enabled = False
+        set_clock()
+        checksums[low_res] = world_checksum(game)
+        memory = texture_memory(game)
+        print(f'{"low res" if low_res else "full res":>8}: draw {phase_stats(draw_times)["mean"]:6.2f} ms/frame, '
+              f'world images {memory["world"] / 2 ** 20:6.1f} MiB, render target {memory["target"] / 2 ** 20:4.1f} MiB '
+              f'(image files {memory["files"] / 2 ** 20:.1f} MiB)')
+    invalidate_assets()
+    print('same world state' if checksums[False] == checksums[True] else 'DIFFERENT world state')
+    if checksums[False] != checksums[True]:
+        raise SystemExit(1)
+
+
+def bench_atlas(args):
+    """
+    Loading the game with every frame and map tile in its own surface vs. packed into texture atlas pages:
+    load time, number of source textures and their memory, atlas occupancy. Both must draw the same pixels
+    after the demo run, also with the atlas loaded from an asset pack
+    """
+    import tempfile
+    from main import Game
+    from inputs import ScriptedInput, DEMO_SCRIPT
+    from assetpack import write_pack
+    from support import invalidate_assets, use_texture_atlas
+    import support
+
+    def demo_frame(game):
+        for _ in range(args.frames * round(SIMULATION_RATE / FRAMERATE)):
+            game.update_world(SIMULATION_STEP)
+        game.draw_world(game.player.rect.x)
+        return pygame.image.tobytes(game.display_surface, 'RGB')
+
+    screens = {}
+    for enabled in (False, True):
+        invalidate_assets()
+        use_texture_atlas(enabled)
+        start = time.perf_counter()
+        game = Game(asset_pack=None, inputs=ScriptedInput(DEMO_SCRIPT), seed=0, headless=True)
+        load = (time.perf_counter() - start) * 1000
+        memory = texture_memory(game)
+        frames = [frame for key, asset in support.asset_cache.items() if key[0] == 'frames' for frame in asset]
+        images = frames + [support.flipped_frames[frame] for frame in frames if frame in support.flipped_frames]
+        images += [image for tiles in game.all_sprites.static_layer.tiles.values() for image, _ in tiles]
+        textures = len({id(image.get_parent() or image) for image in images})
+        line = (f'{"atlas" if enabled else "separate":>8}: load {load:7.2f} ms, {len(images)} frames and tiles '
+                f'in {textures} textures, world images {memory["world"] / 2 ** 20:5.1f} MiB')
+        if enabled:
+            stats = support.texture_atlas.stats()
+            line += f' ({stats["pages"]} pages {stats["bytes"] / 2 ** 20:.1f} MiB, {stats["occupancy"]:.1%} occupied)'
+        print(line)
+        screens[enabled] = demo_frame(game)
+
+    pack_path = os.path.join(tempfile.mkdtemp(), 'bench.pack')
+    write_pack(pack_path)
+    invalidate_assets()
+    game = Game(asset_pack=pack_path, inputs=ScriptedInput(DEMO_SCRIPT), seed=0, headless=True)
+    screens['pack'] = demo_frame(game)
+    print(f'    pack: {os.path.getsize(pack_path) / 2 ** 20:.1f} MiB')
+    os.remove(pack_path)
+    invalidate_assets()
+    use_texture_atlas(TEXTURE_ATLAS)
+
+    same = screens[False] == screens[True] == screens['pack']
+    print('same pixels' if same else 'DIFFERENT pixels')
+    if not same:
+        raise SystemExit(1)
+
+
+# synthetic stress maps for the frames suite: size in tiles and number of entity spawns
+SCENARIOS = {
+    'small': {'width': 60, 'height': 30, 'enemies': 10, 'coins': 30, 'hearts': 5},
+    'medium': {'width': 200, 'height': 60, 'enemies': 50, 'coins': 150, 'hearts': 20},
+    'large': {'width': 500, 'height': 200, 'enemies': 200, 'coins': 600, 'hearts': 60},
+}
+PHASES = ('update', 'collision', 'respawn', 'draw', 'ui')
+MIN_REGRESSION_MS = 0.05  # smaller differences are noise, never reported as regressions
+
+
+def write_synthetic_map(path, width, height, enemies, coins, hearts, seed=0):
+    """
+    Writes a Tiled map using the game's tile images: terrain from synthetic_tiles,
+    bushes on the floor and Player, Enemy, Objective and Health objects in the 'Entities' layer
+    :param path: .tmx file to write
+    """
+    rng = random.Random(seed)
+    assets = os.path.abspath('Assety do gry')
+    solid = set(synthetic_tiles(width, height, seed))
+    floor = height - 2  # first floor row
+
+    main_rows = [','.join('1' if (x, y) in solid else '0' for x in range(width)) for y in range(height)]
+    decoration_rows = [','.join('2' if y == floor - 1 and x % 7 == 3 else '0' for x in range(width))
+                       for y in range(height)]
+
+    objects = [f'<object id="1" name="Player" x="{2 * TILE_SIZE}" y="{floor * TILE_SIZE - 80}"/>']
+    step = (width - 2) * TILE_SIZE / enemies
+    for i in range(enemies):
+        objects.append(f'<object id="{len(objects) + 1}" name="Enemy" x="{TILE_SIZE + i * step:.0f}" '
+                       f'y="{(floor - 1) * TILE_SIZE}" width="{max(step * 0.8, 64):.0f}" height="{TILE_SIZE}"/>')
+    for name, count in (('Objective', coins), ('Health', hearts)):
+        for _ in range(count):
+            x = rng.randrange(1, width - 1) * TILE_SIZE
+            y = (floor - rng.randint(1, 4)) * TILE_SIZE
+            objects.append(f'<object id="{len(objects) + 1}" name="{name}" x="{x}" y="{y}" '
+                           f'width="{TILE_SIZE}" height="{TILE_SIZE}"/>')
+
+    newline = '\n'
+    with open(path, 'w') as file:
+        file.write(f'''<?xml version="1.0" encoding="UTF-8"?>
+<map version="1.10" orientation="orthogonal" renderorder="right-down" width="{width}" height="{height}" tilewidth="{TILE_SIZE}" tileheight="{TILE_SIZE}" infinite="0" nextlayerid="4" nextobjectid="{len(objects) + 1}">
+ <tileset firstgid="1" name="synthetic" tilewidth="32" tileheight="33" tilecount="2" columns="0">
+  <grid orientation="orthogonal" width="1" height="1"/>
+  <tile id="0"><image source="{join(assets, 'Tiles', '1 Tiles', 'Tile_02.png')}" width="32" height="32"/></tile>
+  <tile id="1"><image source="{join(assets, 'Tiles', '3 Objects', 'Bushes', '1.png')}" width="32" height="33"/></tile>
+ </tileset>
+ <layer id="1" name="Main" width="{width}" height="{height}">
+  <data encoding="csv">
+{(',' + newline).join(main_rows)}
+  </data>
+ </layer>
+ <layer id="2" name="Decorations" width="{width}" height="{height}">
+  <data encoding="csv">
+{(',' + newline).join(decoration_rows)}
+  </data>
+ </layer>
+ <objectgroup id="3" name="Entities">
+  {(newline + '  ').join(objects)}
+ </objectgroup>
+</map>
+''')
+
+
+def phase_stats(times):
+    """
+    :param times: per frame times in ms
+    :return: dict with mean, median, 95th percentile and max
+    """
+    ordered = sorted(times)
+    return {
+        'mean': sum(ordered) / len(ordered),
+        'p50': ordered[len(ordered) // 2],
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'max': ordered[-1]
+    }
+
+
+def run_scenario(map_path, frames):
+    """
+    Runs the game on a map for a number of rendered frames (SIMULATION_RATE / FRAMERATE fixed steps each)
+    with the demo input script and a simulated clock, timing every phase of the game loop with the profiler
+    :return: dict phase -> per frame times in ms
+    """
+    from main import Game
+    from inputs import ScriptedInput, DEMO_SCRIPT
+    from timer import set_clock
+    from profiler import profiler
+
+    # the whole map loaded, so the scenarios grow with their entity count (streaming would keep only a few alive)
+    game = Game(inputs=ScriptedInput(DEMO_SCRIPT), map_path=map_path, stream_distance=None)
+    ticks = [pygame.time.get_ticks() + 1]
+    set_clock(lambda: ticks[0])
+    steps_per_frame = round(SIMULATION_RATE / FRAMERATE)
+    times = {phase: [] for phase in PHASES}
+
+    profiler.enabled = True
+    for _ in range(frames):
+        unupdated_x = game.player.rect.x
+        for _ in range(steps_per_frame):
+            game.update_world(SIMULATION_STEP)
+            ticks[0] += SIMULATION_STEP * 1000
+        game.draw_world(unupdated_x)
+        profiler.end_frame()
+        for phase in PHASES:
+            times[phase].append(profiler.last_frame.get(phase, 0.0))
+    profiler.enabled = False
+    set_clock()
+    return times
+
+
+def compare_reports(report, baseline, threshold):
+    """
+    :param threshold: allowed relative slowdown of a phase mean, e.g. 0.2 = 20 %
+    :return: list of regression descriptions
+    """
+    regressions = []
+    for name, scenario in report['scenarios'].items():
+        old_scenario = baseline['scenarios'].get(name)
+        if not old_scenario:
+            continue
+        for phase, stats in scenario['phases'].items():
+            old = old_scenario['phases'].get(phase)
+            if not old:
+                continue
+            if stats['mean'] > old['mean'] * (1 + threshold) and stats['mean'] - old['mean'] > MIN_REGRESSION_MS:
+                regressions.append(f'{name}/{phase}: {old["mean"]:.3f} -> {stats["mean"]:.3f} ms/frame')
+    return regressions
+
+
+def bench_frames(args):
+    """
+    Per phase frame times of the whole game on synthetic maps of increasing size.
+    Writes a JSON/CSV report and fails if a phase got slower than in the baseline report
+    """
+    import csv
+    import json
+    import tempfile
+
+    folder = tempfile.mkdtemp()
+    report = {'frames': args.frames, 'scenarios': {}}
+    for name in args.scenarios.split(','):
+        params = SCENARIOS[name]
+        map_path = join(folder, f'{name}.tmx')
+        write_synthetic_map(map_path, **params)
+        times = run_scenario(map_path, args.frames)
+        phases = {phase: phase_stats(times[phase]) for phase in PHASES}
+        phases['frame'] = phase_stats([sum(frame) for frame in zip(*(times[phase] for phase in PHASES))])
+        report['scenarios'][name] = {**params, 'phases': phases}
+        print(f'{name:>8} {params["width"]}x{params["height"]}: ' +
+              ', '.join(f'{phase} {stats["mean"]:.2f}' for phase, stats in phases.items()) + ' ms/frame')
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=1)
+    if args.csv:
+        with open(args.csv, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['scenario', 'phase', 'mean', 'p50', 'p95', 'max'])
+            for name, scenario in report['scenarios'].items():
+                for phase, stats in scenario['phases'].items():
+                    writer.writerow([name, phase] + [f'{stats[key]:.4f}' for key in ('mean', 'p50', 'p95', 'max')])
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare_reports(report, json.load(file), args.threshold)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            raise SystemExit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('suite', choices=['collision', 'draw', 'startup', 'frames', 'parallax', 'projectiles',
+                                          'entities', 'timers', 'streaming', 'replay', 'dirty', 'sprites',
+                                          'lowres', 'atlas'])
+    parser.add_argument('--width', type=int, help='map width in tiles (default 500, 2000 for streaming)')
+    parser.add_argument('--height', type=int, default=200, help='map height in tiles')
+    parser.add_argument('--enemies', type=int, help='enemy spawns (default 200, 1000 for entities)')
+    parser.add_argument('--sprites', type=int, default=2000, help='dynamic sprites for the draw suite')
+    parser.add_argument('--frames', type=int, default=60)
+    parser.add_argument('--scenarios', default='small,medium,large', help=f'any of: {", ".join(SCENARIOS)}')
+    parser.add_argument('--json', help='write the frames report as JSON')
+    parser.add_argument('--csv', help='write the frames report as CSV')
+    parser.add_argument('--baseline', help='JSON report to compare with, exits with 1 on a regression')
+    parser.add_argument('--replay', help='replay file for the replay suite, records the demo script if not set')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed relative slowdown per phase')
+    args = parser.parse_args()
+    if args.width is None:
+        args.width = 2000 if args.suite == 'streaming' else 500
+    if args.enemies is None:
+        args.enemies = 1000 if args.suite == 'entities' else 200
+
+    if args.suite == 'collision':
+        bench_collision(args)
+    elif args.suite == 'draw':
+        bench_draw(args)
+    elif args.suite == 'startup':
+        bench_startup(args)
+    elif args.suite == 'frames':
+        bench_frames(args)
+    elif args.suite == 'parallax':
+        bench_parallax(args)
+    elif args.suite == 'projectiles':
+        bench_projectiles(args)
+    elif args.suite == 'entities':
+        bench_entities(args)
+    elif args.suite == 'timers':
+        bench_timers(args)
+    elif args.suite == 'streaming':
+        bench_streaming(args)
+    elif args.suite == 'replay':
+        bench_replay(args)
+    elif args.suite == 'dirty':
+        bench_dirty(args)
+    elif args.suite == 'sprites':
+        bench_sprites(args)
+    elif args.suite == 'lowres':
+        bench_lowres(args)
+    elif args.suite == 'atlas':
+        bench_atlas(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+from settings import *
+
+
+def merge_rects(rects):
+    """
+    :param rects: screen areas, may overlap
+    :return: list of rects covering the same areas, overlapping rects merged into their union
+    """
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        i = 0
+        while i < len(merged):
+            if merged[i].colliderect(rect):
+                # the union can reach rects that were checked already, start over
+                rect.union_ip(merged.pop(i))
+                i = 0
+            else:
+                i += 1
+        merged.append(rect)
+    return merged
+
+
+class DirtyRects:
+    """
+    Screen areas changed during a frame (moved sprites, hud, menu buttons). update() pushes only those
+    to the window instead of the whole screen, falling back to a full update when everything moved
+    (camera scroll) or when the changed areas cover most of the screen anyway
+    """
+
+    def __init__(self, enabled=DIRTY_RECTS, max_coverage=DIRTY_MAX_COVERAGE):
+        """
+        :param enabled: False updates the whole window every frame
+        :param max_coverage: part of the screen (0-1) above which the whole window is updated
+        """
+        self.enabled = enabled
+        self.max_coverage = max_coverage
+        self.screen = pygame.Rect(0, 0, WINDOW_WIDTH, WINDOW_HEIGHT)
+        self.rects = []
+        self.full = True  # the first frame is always pushed whole
+        self.pixels = 0  # pixels pushed to the window in the last frame
+        self.total_pixels = 0
+        self.frames = 0
+
+    def add(self, rect):
+        self.rects.append(rect)
+
+    def add_all(self, rects):
+        self.rects.extend(rects)
+
+    def invalidate(self):
+        # the whole screen changed
+        self.full = True
+
+    def update(self):
+        """
+        Pushes the changed areas of the frame to the window, called once per frame instead of pygame.display.update
+        """
+        rects = []
+        if self.enabled and not self.full:
+            rects = [rect.clip(self.screen) for rect in merge_rects(self.rects)]
+            rects = [rect for rect in rects if rect]
+            if sum(rect.w * rect.h for rect in rects) > self.screen.w * self.screen.h * self.max_coverage:
+                self.full = True
+        if self.full or not self.enabled:
+            pygame.display.update()
+            self.pixels = self.screen.w * self.screen.h
+        else:
+            if rects:
+                pygame.display.update(rects)
+            self.pixels = sum(rect.w * rect.h for rect in rects)
+        self.total_pixels += self.pixels
+        self.frames += 1
+        self.rects.clear()
+        self.full = False
+
+    def stats(self):
+        """
+        :return: dict with the pixels pushed in the last frame and per frame on average
+        """
+        return {'pixels': self.pixels, 'average': self.total_pixels / self.frames if self.frames else 0}
@@ -22,6 +22,17 @@ class GameOver:
 
         self._position_elements()
 
+        # the game world under the menu doesn't change, so the last gameplay frame is kept
+        # and everything static is drawn on it once
+        self.background = display_surface.copy()
+        self._compose_background()
+        self.button_texts = [self._render_shadowed(self.text_font, button["text"], self.text_color)
+                             for button in self.buttons]
+        self.hovered = None  # index of the button under the mouse
+        self.surface = None  # whole cached screen
+        self.shown = False  # drawn on the screen at least once
+        self._compose()
+
     def _position_elements(self):
         total_height = len(self.buttons) * (self.buttons[0]["rect"].height + 0)
         start_y = (WINDOW_HEIGHT - total_height) // 2 + 50 * SCALE
@@ -30,35 +41,63 @@ class GameOver:
             button["rect"].centerx = WINDOW_WIDTH // 2
             button["rect"].y = start_y + i * (button["rect"].height + 5)
 
-    def draw(self):
+    def _render_shadowed(self, font, text, color):
+        return font.render(text, True, color), font.render(text, True, self.shadow_color)
+
+    def _compose_background(self):
+        """
+        Darkened last gameplay frame with the title and the final score
+        """
         overlay = pygame.Surface((WINDOW_WIDTH, WINDOW_HEIGHT), pygame.SRCALPHA)
         overlay.fill((0, 0, 0, 180))
-        self.display_surface.blit(overlay, (0, 0))
+        self.background.blit(overlay, (0, 0))
 
-        title_text = self.title_font.render("GAME OVER", True, self.title_color)
-        title_shadow = self.title_font.render("GAME OVER", True, self.shadow_color)
+        title_text, title_shadow = self._render_shadowed(self.title_font, "GAME OVER", self.title_color)
         title_rect = title_text.get_rect(center=(WINDOW_WIDTH // 2, WINDOW_HEIGHT // 3))
 
-        self.display_surface.blit(title_shadow, (title_rect.x + 2, title_rect.y + 2))
-        self.display_surface.blit(title_text, title_rect)
+        self.background.blit(title_shadow, (title_rect.x + 2, title_rect.y + 2))
+        self.background.blit(title_text, title_rect)
 
-        score_text = self.text_font.render(f"Final Score: {self.score}", True, self.text_color)
-        score_shadow = self.text_font.render(f"Final Score: {self.score}", True, self.shadow_color)
+        score_text, score_shadow = self._render_shadowed(self.text_font, f"Final Score: {self.score}", self.text_color)
         score_rect = score_text.get_rect(center=(WINDOW_WIDTH // 2, title_rect.bottom + 20 * SCALE))
 
-        self.display_surface.blit(score_shadow, (score_rect.x + 2, score_rect.y + 2))
-        self.display_surface.blit(score_text, score_rect)
+        self.background.blit(score_shadow, (score_rect.x + 2, score_rect.y + 2))
+        self.background.blit(score_text, score_rect)
 
-        for button in self.buttons:
-            pygame.draw.rect(self.display_surface, (70, 70, 70), button["rect"])
-            pygame.draw.rect(self.display_surface, (100, 100, 100), button["rect"], 3)
+    def _compose(self):
+        """
+        Cached screen: background and the buttons (hovered one highlighted)
+        """
+        self.surface = self.background.copy()
+        for i, button in enumerate(self.buttons):
+            fill_color = (100, 100, 100) if i == self.hovered else (70, 70, 70)
+            pygame.draw.rect(self.surface, fill_color, button["rect"])
+            pygame.draw.rect(self.surface, (100, 100, 100), button["rect"], 3)
 
-            text = self.text_font.render(button["text"], True, self.text_color)
-            text_shadow = self.text_font.render(button["text"], True, self.shadow_color)
+            text, text_shadow = self.button_texts[i]
             text_rect = text.get_rect(center=button["rect"].center)
 
-            self.display_surface.blit(text_shadow, (text_rect.x + 1, text_rect.y + 1))
-            self.display_surface.blit(text, text_rect)
+            self.surface.blit(text_shadow, (text_rect.x + 1, text_rect.y + 1))
+            self.surface.blit(text, text_rect)
+
+    def draw(self):
+        """
+        Draws the cached screen, composing it again only when the hovered button changes
+        :return: screen areas that changed since the last draw
+        """
+        mouse_pos = pygame.mouse.get_pos()
+        hovered = next((i for i, button in enumerate(self.buttons) if button["rect"].collidepoint(mouse_pos)), None)
+        changed = []
+        if not self.shown:
+            changed.append(self.display_surface.get_rect())
+            self.shown = True
+        if hovered != self.hovered:
+            # the button losing and the one getting the highlight
+            changed += [self.buttons[i]["rect"] for i in (self.hovered, hovered) if i is not None]
+            self.hovered = hovered
+            self._compose()
+        self.display_surface.blit(self.surface, (0, 0))
+        return changed
 
     def handle_event(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
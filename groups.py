@@ -1,5 +1,181 @@
+from math import ceil
 from settings import *
-from sprites import Player, Enemy
+from sprites import Player, Enemy, Projectile
+from spatial import DynamicGrid
+
+
+class ChunkedLayer:
+    """
+    Static map tiles (terrain, decorations) baked into fixed size chunk surfaces,
+    so drawing the map costs a few blits of the chunks visible on the screen
+    instead of one blit per tile. Chunks are baked when they are first needed
+    and can be released again (the world streamer releases chunks far from the camera)
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, scale=1):
+        """
+        :param chunk_size: width and height of one chunk in world units
+        :param scale: world units per pixel of the chunk surfaces (the render scale), chunk_size is a multiple of it
+        """
+        self.chunk_size = chunk_size
+        self.scale = scale
+        self.tiles = {}  # (column, row) -> [(image, pixel position in the chunk)] in drawing order
+        self.chunks = {}  # (column, row) -> baked chunk surface
+
+    def add(self, image, pos):
+        """
+        Adds an image to every chunk it overlaps. Images are drawn in the order they are added
+        :param image: tile surface (at the render scale)
+        :param pos: top left world position of the tile
+        """
+        size = self.chunk_size
+        scale = self.scale
+        x, y = int(pos[0]), int(pos[1])
+        for col in range(x // size, (x + image.get_width() * scale - 1) // size + 1):
+            for row in range(y // size, (y + image.get_height() * scale - 1) // size + 1):
+                self.tiles.setdefault((col, row), []).append(
+                    (image, ((x - col * size) // scale, (y - row * size) // scale)))
+                self.chunks.pop((col, row), None)  # baked again with the new tile
+
+    def bake(self, key):
+        """
+        :param key: (column, row) of the chunk
+        :return: chunk surface with its tiles drawn on it, None if there are no tiles in the chunk
+        """
+        chunk = self.chunks.get(key)
+        if chunk is None and key in self.tiles:
+            # SRCALPHA surfaces already have the display alpha format, no convert_alpha needed
+            chunk = pygame.Surface((self.chunk_size // self.scale, self.chunk_size // self.scale), pygame.SRCALPHA)
+            chunk.fblits(self.tiles[key])
+            self.chunks[key] = chunk
+        return chunk
+
+    def release(self, key):
+        # frees the chunk surface, it is baked again when needed
+        self.chunks.pop(key, None)
+
+    def keys(self, rect):
+        """
+        :param rect: world area
+        :return: (column, row) of every chunk with tiles the area overlaps
+        """
+        size = self.chunk_size
+        left, top = int(rect[0]), int(rect[1])
+        return [(col, row)
+                for col in range(left // size, (left + int(rect[2]) - 1) // size + 1)
+                for row in range(top // size, (top + int(rect[3]) - 1) // size + 1)
+                if (col, row) in self.tiles]
+
+    def draw(self, surface, offset):
+        """
+        Draws only the chunks intersecting the camera view
+        :param surface: surface to draw on, the whole camera view at the render scale
+        :param offset: camera offset in world units
+        :return: number of blitted chunks
+        """
+        scale = self.scale
+        keys = self.keys((-offset.x, -offset.y, surface.get_width() * scale, surface.get_height() * scale))
+        size = self.chunk_size
+        for col, row in keys:
+            surface.blit(self.bake((col, row)), ((col * size + offset.x) / scale, (row * size + offset.y) / scale))
+        return len(keys)
+
+
+class RenderQueue:
+    """
+    Images to draw in a frame, sorted into render layers. Every layer is drawn with one fblits call,
+    lowest layer first, images of a layer in the order they were submitted
+    """
+
+    def __init__(self):
+        self.layers = {}  # layer -> [(image, screen position)]
+
+    def submit(self, entry, layer=LAYER_MAIN):
+        """
+        :param entry: (image, screen position)
+        :param layer: render layer, higher layers are drawn on top
+        """
+        entries = self.layers.get(layer)
+        if entries is None:
+            entries = self.layers[layer] = []
+        entries.append(entry)
+
+    def draw(self, surface):
+        """
+        Draws and empties the queue
+        :param surface: surface to draw on
+        :return: number of drawn images
+        """
+        count = 0
+        for layer in sorted(self.layers):
+            entries = self.layers[layer]
+            surface.fblits(entries)
+            count += len(entries)
+        self.layers.clear()
+        return count
+
+
+class EntityGroup(pygame.sprite.Group):
+    """
+    Group of the game entities that also keeps them in a grid by their collision rects
+    (enemy hitbox, projectile hitbox, pickup rect), so player vs entity checks only look at nearby entities.
+    Pickups never move and are put in the grid once, enemies and projectiles are moved in it by refresh()
+    """
+
+    def __init__(self, cell_size=ENTITY_CELL_SIZE):
+        """
+        :param cell_size: grid cell size in pixels
+        """
+        super().__init__()
+        self.grid = DynamicGrid(cell_size)
+        self.pending = []  # added sprites not in the grid yet (their hitboxes are made after they join groups)
+        self.moving = {}  # enemy/projectile in the grid -> its collision rect
+        self.broad_phase = True  # False: query returns every entity (no grid)
+        self.missed = False  # entities were added while the broad phase was off, not all of them are in the grid
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self.pending.append(sprite)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.grid.remove(sprite)
+        self.moving.pop(sprite, None)
+
+    def refresh(self):
+        """
+        Puts newly added entities into the grid and moves the moving ones, called once per simulation step
+        before the collision checks
+        """
+        if not self.broad_phase:
+            # nothing goes into the grid, the entities added meanwhile are put in when the broad phase is on again
+            if self.pending:
+                self.pending.clear()
+                self.missed = True
+            return
+        if self.missed:
+            self.pending = self.sprites()
+            self.missed = False
+        for sprite in self.pending:
+            if sprite in self.grid or not self.has(sprite) or isinstance(sprite, Player):
+                continue
+            if isinstance(sprite, Enemy):
+                self.moving[sprite] = sprite.hitbox
+            elif isinstance(sprite, Projectile):
+                self.moving[sprite] = sprite.proj_hitbox
+            self.grid.insert(sprite, self.moving.get(sprite, sprite.rect))
+        self.pending.clear()
+
+        self.grid.move_all(self.moving.items())
+
+    def query(self, rect):
+        """
+        :param rect: area to check (player hitbox, attack hitbox)
+        :return: entities that may collide with it, in the order they were added
+        """
+        if not self.broad_phase:
+            return self.sprites()
+        return self.grid.query(rect)
 
 
 class AllSprites(pygame.sprite.Group):
@@ -7,16 +183,65 @@ class AllSprites(pygame.sprite.Group):
     Handles proper displaying of all sprites from all groups properly on the display
     '''
 
-    def __init__(self):
+    def __init__(self, cull_margin=CULL_MARGIN, scale=1):
         """
         Calls games surface to draw sprites on
+        :param cull_margin: how far outside of the screen (in pixels) sprites are still drawn
+        :param scale: render scale (world units per drawn pixel), above 1 the world is drawn into a small
+        target surface with images loaded at that scale, and upscaled to the display once per frame
         """
         super().__init__()
         self.display_surface = pygame.display.get_surface()
+        self.scale = scale
+        if scale == 1:
+            self.target = self.display_surface  # the background and the world are drawn here
+            self.upscaled = None
+        else:
+            self.target = pygame.Surface((ceil(WINDOW_WIDTH / scale), ceil(WINDOW_HEIGHT / scale))).convert()
+            self.upscaled = pygame.Surface((self.target.get_width() * scale, self.target.get_height() * scale))
         self.offset = pygame.Vector2()
         self.centered_camera = False
+        self.static_layer = ChunkedLayer(CHUNK_SIZE * scale, scale)  # baked map tiles, drawn below all sprites
+        self.queue = RenderQueue()
+        self.render = True  # False in headless mode: draw() only moves the camera
+
+        self.cull_margin = cull_margin
+        self.view_rect = pygame.FRect(0, 0, WINDOW_WIDTH, WINDOW_HEIGHT)  # world area seen by the camera
+        self.draw_stats = {'chunks': 0, 'sprites': 0, 'culled': 0}  # blits done/skipped in the last frame
 
-    def draw(self, target_pos, map_width, map_height):
+        # dirty rects: what was drawn where in the last frame, to find the screen areas that changed
+        self.track_dirty = DIRTY_RECTS and scale == 1  # False: every frame counts as changed everywhere
+        self.drawn = {}  # sprite -> (image, screen position)
+        self.drawn_offset = None  # camera offset of the last frame
+        self.camera_moved = True  # the whole screen changed in the last draw
+        self.dirty = []  # screen areas changed in the last draw when the camera did not move
+
+    def update(self, dt):
+        """
+        One simulation step of all sprites, remembering where they were before it
+        :param dt: simulation step in seconds
+        """
+        for sprite in self.sprites():
+            sprite.previous_pos = sprite.rect.topleft
+        super().update(dt)
+
+    @staticmethod
+    def interpolate(sprite, alpha):
+        """
+        :param alpha: 0 = position before the last simulation step, 1 = current position
+        :return: drawing position of the sprite between the last two simulation states
+        """
+        x, y = sprite.rect.topleft
+        previous_x, previous_y = sprite.previous_pos
+        return previous_x + (x - previous_x) * alpha, previous_y + (y - previous_y) * alpha
+
+    def draw(self, target_pos, map_width, map_height, alpha=1):
+        """
+        :param target_pos: world position the camera follows
+        :param map_width: map width in pixels
+        :param map_height: map height in pixels
+        :param alpha: interpolation between the last two simulation states (1 = latest state)
+        """
         # centered camera following the player at all times,
         # but stopping at map's edges
         desired_offset_x = -(target_pos[0] - WINDOW_WIDTH / 2)
@@ -30,40 +255,78 @@ class AllSprites(pygame.sprite.Group):
                 desired_offset_x <= 0
         )
 
-        # ensuring player model is always at the top
-        player_sprite = None
+        if not self.render:
+            return
+
+        # sprites outside of the camera view (and the margin around it) are skipped
+        self.view_rect.update(-self.offset.x - self.cull_margin, -self.offset.y - self.cull_margin,
+                              WINDOW_WIDTH + self.cull_margin * 2, WINDOW_HEIGHT + self.cull_margin * 2)
+        visible_sprites = self.view_rect.collideobjectsall(self.sprites())
+        self.draw_stats['chunks'] = self.static_layer.draw(self.target, self.offset)
+        self.draw_stats['culled'] = len(self) - len(visible_sprites)
 
-        for sprite in self:
-            if isinstance(sprite, Player):
-                player_sprite = sprite
-            else:
-                offset_pos = sprite.rect.topleft + self.offset
-                self.display_surface.blit(sprite.image, offset_pos)
+        # every visible sprite submits its image at the interpolated screen position,
+        # the queue draws them layer by layer in a few fblits calls
+        submit = self.queue.submit
+        drawn = {}
+        offset_x, offset_y = self.offset
+        scale = self.scale
+        inverse = 1 / scale  # world units to target pixels
+        for sprite in visible_sprites:
+            x, y = sprite.rect.topleft
+            previous_x, previous_y = sprite.previous_pos
+            entry = (sprite.image, ((offset_x + (previous_x + (x - previous_x) * alpha)) * inverse,
+                                    (offset_y + (previous_y + (y - previous_y) * alpha)) * inverse))
+            drawn[sprite] = entry
+            submit(entry, sprite.render_layer)
+            if sprite.extra_images:
+                pos = entry[1]
+                for i, (image, (extra_x, extra_y)) in enumerate(sprite.extra_entries((pos[0] * scale, pos[1] * scale))):
+                    extra = (image, (extra_x * inverse, extra_y * inverse))
+                    submit(extra, sprite.render_layer)
+                    drawn[(sprite, i)] = extra
 
-                # debugging htiboxes
+            # debugging htiboxes
             # if hasattr(sprite, 'attack_hitbox'):
             #     pygame.draw.rect(self.display_surface, (0, 255, 255), sprite.attack_hitbox.move(self.offset), 2)
-            # self.display_surface.blit(sprite.image, sprite.rect.topleft + self.offset)
             # if hasattr(sprite, 'hitbox'):
             #     pygame.draw.rect(self.display_surface, (255, 0, 0), sprite.hitbox.move(self.offset), 2)
             # if hasattr(sprite, 'proj_hitbox'):
             #     pygame.draw.rect(self.display_surface, (0, 255, 0), sprite.proj_hitbox.move(self.offset), 2)
+        self.draw_stats['sprites'] = self.queue.draw(self.target)
 
-        if player_sprite:
-            offset_pos = player_sprite.rect.topleft + self.offset
-            self.display_surface.blit(player_sprite.image, offset_pos)
-
-            # kick image render
-            if player_sprite.attacking:
-                kick_img = player_sprite.animations['kick']
-                kick_img = pygame.transform.scale(player_sprite.animations['kick'], (
-                    int(kick_img.get_width() * SCALE * 0.6), int(kick_img.get_height() * SCALE * 0.6)))
-                if player_sprite.flip:
-                    kick_img = pygame.transform.flip(kick_img, True, False)
-                    kick_rect = kick_img.get_rect(left=player_sprite.attack_hitbox.left,
-                                                  centery=player_sprite.attack_hitbox.centery - 15
-                                                  )
-                else:
-                    kick_rect = kick_img.get_rect(right=player_sprite.attack_hitbox.right,
-                                                  centery=player_sprite.attack_hitbox.centery - 15)
-                self.display_surface.blit(kick_img, kick_rect.topleft + self.offset)
+        if self.track_dirty:
+            self.find_dirty(drawn)
+        else:
+            self.camera_moved = True
+        if self.upscaled:
+            self.present()
+
+    def present(self):
+        # the only full size blit of the frame: the low resolution target scaled to the display
+        pygame.transform.scale(self.target, self.upscaled.get_size(), self.upscaled)
+        self.display_surface.blit(self.upscaled, (0, 0))
+
+    @staticmethod
+    def screen_rect(entry):
+        """
+        :param entry: (image, screen position)
+        :return: screen area covered by the drawn image (blits truncate the position)
+        """
+        image, (x, y) = entry
+        return image.get_rect(topleft=(int(x), int(y)))
+
+    def find_dirty(self, drawn):
+        """
+        Finds the screen areas that changed since the last frame: where sprites were and are drawn now
+        if they moved, changed image, appeared or disappeared. Everything changed if the camera moved
+        :param drawn: sprite -> (image, screen position) drawn in this frame
+        """
+        self.camera_moved = self.offset != self.drawn_offset
+        self.drawn_offset = pygame.Vector2(self.offset)
+        self.dirty = []
+        if not self.camera_moved:
+            # entries only in one of the frames: sprites that moved or changed image (both their
+            # entries differ), appeared or disappeared
+            self.dirty = [self.screen_rect(entry) for _, entry in drawn.items() ^ self.drawn.items()]
+        self.drawn = drawn
@@ -0,0 +1,77 @@
+from settings import *
+from support import scale_image
+
+
+class Hud:
+    def __init__(self, font, heart_frames, heart_size=(45, 45)):
+        """
+        Player hearts, score and countdown composed into one cached surface,
+        rendered again only when one of the shown values changes
+        :param font: font for the score and the timer
+        :param heart_frames: hp_hearts frames (0 = full heart, 2 = lost heart)
+        :param heart_size: size of the hearts on the screen
+        """
+        self.font = font
+        self.heart_size = heart_size
+        # hearts are scaled once, with premultiplied alpha for composing
+        self.full_heart = scale_image(heart_frames[0], heart_size).premul_alpha()
+        self.lost_heart = scale_image(heart_frames[2], heart_size).premul_alpha()
+
+        self.values = None  # (health, max health, score, countdown) shown on the cached surface
+        self.texts = {}  # (text, color) -> rendered text surface
+        self.surface = None
+        self.renders = 0  # how many times the hud surface was composed
+
+    def render_text(self, text, color):
+        key = (text, color)
+        if key not in self.texts:
+            # only the current and the previous texts are kept
+            if len(self.texts) > 8:
+                self.texts.clear()
+            self.texts[key] = self.font.render(text, True, color).premul_alpha()
+        return self.texts[key]
+
+    def compose(self, health, max_health, score, countdown):
+        """
+        Draws everything on the cached hud surface (premultiplied alpha, so blending it
+        onto the screen gives the same pixels as drawing each part on the screen)
+        """
+        parts = []
+        for i in range(max_health):
+            # full heart for remaining HP, grey heart for lost HP
+            heart = self.full_heart if i < health else self.lost_heart
+            parts.append((heart, (i * self.heart_size[0], 0)))
+
+        score_text = f"Score: {score}"
+        parts.append((self.render_text(score_text, (0, 0, 0)), (11, 41)))
+        parts.append((self.render_text(score_text, (255, 215, 0)), (10, 40)))
+
+        timer_text = f"Time: {countdown // 60}:{countdown % 60:02d}"
+        timer_color = (255, 215, 0) if countdown >= 6 else (255, 0, 0)
+        parts.append((self.render_text(timer_text, (0, 0, 0)), (11, 81)))
+        parts.append((self.render_text(timer_text, timer_color), (10, 80)))
+
+        width = max(image.get_width() + pos[0] for image, pos in parts)
+        height = max(image.get_height() + pos[1] for image, pos in parts)
+        self.surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        for image, pos in parts:
+            self.surface.blit(image, pos, special_flags=pygame.BLEND_PREMULTIPLIED)
+        self.values = (health, max_health, score, countdown)
+        self.renders += 1
+
+    def draw(self, surface, health, max_health, score, countdown):
+        """
+        :param surface: surface to draw on
+        :param health: current player health
+        :param max_health: max player health
+        :param score: current score
+        :param countdown: seconds left
+        :return: screen area that changed since the last draw, None if nothing changed
+        """
+        if self.values == (health, max_health, score, countdown):
+            surface.blit(self.surface, (0, 0), special_flags=pygame.BLEND_PREMULTIPLIED)
+            return None
+        changed = self.surface.get_rect() if self.surface else None
+        self.compose(health, max_health, score, countdown)
+        area = surface.blit(self.surface, (0, 0), special_flags=pygame.BLEND_PREMULTIPLIED)
+        return area.union(changed) if changed else area
@@ -0,0 +1,52 @@
+import pygame
+
+
+class KeyState:
+    def __init__(self, pressed=()):
+        """
+        Replacement for the result of pygame.key.get_pressed()
+        :param pressed: pygame key constants held down
+        """
+        self.pressed = frozenset(pressed)
+
+    def __getitem__(self, key):
+        return key in self.pressed
+
+
+class ScriptedInput:
+    def __init__(self, script, repeat=True):
+        """
+        Scripted keyboard input used instead of pygame.key.get_pressed (headless runs, bots).
+        Every call returns the keys for one simulation step
+        :param script: list of (steps, keys) - keys held down (pygame key constants) for that many steps
+        :param repeat: start the script again after its end, otherwise no keys are pressed after it
+        """
+        self.script = [(steps, KeyState(keys)) for steps, keys in script]
+        self.repeat = repeat
+        self.index = 0  # current script entry
+        self.step = 0  # steps done in the current entry
+        self.idle = KeyState()
+
+    def __call__(self):
+        if self.index >= len(self.script):
+            if not self.repeat or not self.script:
+                return self.idle
+            self.index = 0
+        steps, keys = self.script[self.index]
+        self.step += 1
+        if self.step >= steps:
+            self.index += 1
+            self.step = 0
+        return keys
+
+
+# walks right, jumps over obstacles now and then and kicks
+DEMO_SCRIPT = [
+    (90, (pygame.K_RIGHT,)),
+    (10, (pygame.K_RIGHT, pygame.K_UP)),
+    (60, (pygame.K_RIGHT,)),
+    (20, (pygame.K_SPACE,)),
+    (90, (pygame.K_LEFT,)),
+    (10, (pygame.K_LEFT, pygame.K_UP)),
+    (40, ()),
+]
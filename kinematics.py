@@ -0,0 +1,101 @@
+"""
+Optional NumPy backend moving all pooled projectiles with a few array operations per simulation step
+instead of one Projectile.update call each. Used with KINEMATICS = 'numpy' (or main.py --kinematics numpy),
+without NumPy installed the game keeps the per sprite updates.
+"""
+import timer
+from settings import *
+from support import flip_frame
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class ProjectileKinematics:
+    """
+    Positions, velocities, hitboxes, lifetimes and animation frames of the projectiles in a pool,
+    stored in arrays indexed by the projectile's pool slot. Projectile rects, hitboxes and images
+    are only written back for the projectiles in the game, once per step after they moved
+    """
+
+    def __init__(self, projectiles):
+        """
+        :param projectiles: every projectile of the pool, the index is the projectile's slot
+        """
+        capacity = len(projectiles)
+        self.projectiles = projectiles
+        self.active = np.zeros(capacity, dtype=bool)
+        # rects are float32 (FRect), the math is done like FRect does it, so positions are the same
+        # as with the per sprite updates
+        self.x = np.zeros(capacity, dtype=np.float32)
+        self.width = np.zeros(capacity, dtype=np.float32)
+        self.hitbox_x = np.zeros(capacity, dtype=np.float32)
+        self.hitbox_width = np.zeros(capacity, dtype=np.float32)
+        self.velocity = np.zeros(capacity)  # direction * speed
+        self.direction = np.zeros(capacity)
+        self.start_time = np.zeros(capacity)  # lifetime timer start
+        self.frame_index = np.zeros(capacity)
+
+        sample = projectiles[0]
+        self.duration = sample.kill_proj.duration
+        self.animation_speed = sample.animation_speed['idle']
+        self.hitbox_offset = sample.hitbox_offset
+        self.frames = sample.animations['idle']
+        self.flipped_frames = [flip_frame(frame) for frame in self.frames]
+
+    def add(self, projectile):
+        """
+        Takes over the state of a spawned (reset) projectile
+        """
+        slot = projectile.slot
+        self.active[slot] = True
+        self.x[slot] = projectile.rect.x
+        self.width[slot] = projectile.rect.width
+        self.hitbox_x[slot] = projectile.proj_hitbox.x
+        self.hitbox_width[slot] = projectile.proj_hitbox.width
+        self.direction[slot] = projectile.direction.x
+        self.velocity[slot] = projectile.direction.x * projectile.speed
+        self.start_time[slot] = projectile.kill_proj.start_time
+        self.frame_index[slot] = projectile.frame_index
+
+    def remove(self, projectile):
+        self.active[projectile.slot] = False
+
+    def step(self, dt):
+        """
+        Moves and animates every projectile in the game and kills the ones that expired
+        or hit the player, the same as Projectile.update does for a single one
+        :param dt: simulation step in seconds
+        """
+        slots = np.flatnonzero(self.active)
+        if not len(slots):
+            return
+        expired = timer.clock() - self.start_time[slots] >= self.duration
+
+        x = (self.x[slots].astype(np.float64) + self.velocity[slots] * dt).astype(np.float32)
+        self.x[slots] = x
+        right = self.direction[slots] > 0
+        flip = self.direction[slots] < 0
+        # facing right: hitbox.midleft = rect.midleft, facing left: hitbox.midright = rect.midright
+        hitbox_x = np.where(right, x, (x + self.width[slots]) - self.hitbox_width[slots])
+        hitbox_x = (hitbox_x.astype(np.float64) + np.where(right, self.hitbox_offset, -self.hitbox_offset))
+        hitbox_x = hitbox_x.astype(np.float32)
+        self.hitbox_x[slots] = hitbox_x
+
+        self.frame_index[slots] += self.animation_speed * dt
+        frame_index = self.frame_index[slots]
+        frames = (frame_index.astype(np.int64) % len(self.frames)).tolist()
+
+        for slot, x, hitbox_x, flip, frame_index, frame, dead in zip(
+                slots.tolist(), x.tolist(), hitbox_x.tolist(), flip.tolist(), frame_index.tolist(), frames,
+                expired.tolist()):
+            projectile = self.projectiles[slot]
+            projectile.rect.x = x
+            projectile.proj_hitbox.x = hitbox_x
+            projectile.flip = flip
+            projectile.frame_index = frame_index
+            projectile.image = self.flipped_frames[frame] if flip else self.frames[frame]
+            if dead or projectile.damaged_player:
+                projectile.kill()
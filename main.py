@@ -1,20 +1,75 @@
+import os
+import argparse
+import random
+from time import perf_counter
 import pygame
 import pytmx
 from settings import *
 from sprites import *
-from groups import AllSprites
+from groups import AllSprites, ChunkedLayer, EntityGroup
 from support import *
 from gameover import GameOver
+from spatial import SpatialGrid, merge_tiles
+from assetpack import load_pack
+from inputs import ScriptedInput, DEMO_SCRIPT
+from timer import set_clock, scheduler
+from profiler import profiler
+from hud import Hud
+from parallax import ParallaxBackground
+from dirty import DirtyRects
+from pool import ProjectilePool
+from spawns import SpawnRegistry
+from streaming import WorldStreamer
+from replay import Recorder, load_replay, replay_game
 
 
 class Game:
-    def __init__(self):
+    def __init__(self, asset_pack=ASSET_PACK, headless=False, inputs=None, map_path=WORLD_MAP, kinematics=KINEMATICS,
+                 stream_distance=STREAM_DISTANCE, seed=None, replay=None, low_res=LOW_RES):
+        """
+        :param asset_pack: baked asset pack to fill the asset cache from on the first start, None to skip it
+        :param headless: simulate without a window (dummy video driver) and without rendering, see run_headless
+        :param inputs: function returning the pressed keys for every simulation step, None for the keyboard
+        :param map_path: Tiled map of the level
+        :param kinematics: projectile movement backend, 'python' or 'numpy' (see kinematics.py)
+        :param stream_distance: chunks this far outside of the screen are loaded (see streaming.py),
+        None loads the whole level
+        :param seed: random seed (enemy speeds, cooldowns, respawn delays), None for an unseeded game
+        :param replay: replay Recorder or ReplayPlayer (replay.py) - the player's input source, called after every
+        simulation step. Timers use the simulated time, so the session plays the same when replayed
+        :param low_res: load the world images at 1/SCALE and draw the world into a small surface upscaled once
+        per frame, sprite rects and physics stay in the same world units
+        """
+        # constructor arguments, a restarted game gets the same ones
+        self.options = {'asset_pack': asset_pack, 'headless': headless, 'inputs': inputs, 'map_path': map_path,
+                        'kinematics': kinematics, 'stream_distance': stream_distance, 'seed': seed, 'replay': replay,
+                        'low_res': low_res}
+        self.headless = headless
+        self.map_path = map_path
+        self.kinematics = kinematics
+        self.stream_distance = stream_distance
+        self.seed = seed
+        self.replay = replay
+        self.low_res = low_res
+        self.render_scale = SCALE if low_res else 1  # world units per drawn pixel
+        set_render_scale(self.render_scale)
+        if seed is not None:
+            random.seed(seed)
+        if headless:
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        # headless runs are faster than real time, so timers use the simulated time
+        self.sim_ticks = 1  # simulated time in ms (timers ignore a start time of 0)
+        set_clock((lambda: self.sim_ticks) if headless or replay else None)
+        scheduler.clear()  # timers of the previous game (restart) must not fire anymore
         pygame.init()
         self.game_over_screen = None
         self.display_surface = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+        if not asset_cache:
+            load_pack(asset_pack)  # falls back to loading from the asset files if missing or stale
         pygame.display.set_caption('Platformer')
         self.font = pygame.font.Font('dogicapixel.ttf', 24)
         self.clock = pygame.time.Clock()
+        self.dirty_rects = DirtyRects()  # changed screen areas pushed to the window at the end of a frame
 
         self.running = True
         self.player_dead = False
@@ -25,24 +80,35 @@ class Game:
             bg_image = import_image('Assety do gry', 'Tiles', '2 Background', 'Day', f'{i}')
             scale_factor = WINDOW_HEIGHT / bg_image.get_height()
             scaled_width = int(bg_image.get_width() * scale_factor)
-            scaled_image = pygame.transform.scale(bg_image, (scaled_width, WINDOW_HEIGHT))
+            scaled_image = scale_world(bg_image, (scaled_width, WINDOW_HEIGHT))
             self.bg_images.append(scaled_image)
         self.bg_width = self.bg_images[0].get_width()
+        bg_speeds = []
+        speed = 1
+        for _ in self.bg_images:  # nearer layers scroll faster
+            bg_speeds.append(speed)
+            speed += 0.2
+        self.background = ParallaxBackground(self.bg_images, bg_speeds, PARALLAX_CACHED_LAYERS, self.render_scale)
+        self.drawn_scroll = None  # background scroll of the last frame
         self.player_pos = 0
 
         # groups
-        self.all_sprites = AllSprites()
-        self.collision_sprites = pygame.sprite.Group()
-        self.entities = pygame.sprite.Group()
+        self.all_sprites = AllSprites(scale=self.render_scale)
+        self.all_sprites.render = not headless
+        self.collision_grid = None  # terrain rects, set in setup()
+        self.entities = EntityGroup()  # entities, indexed for the player vs entity checks
         self.projectiles = pygame.sprite.Group()
         self.health_pickups = pygame.sprite.Group()
         self.collectibles = pygame.sprite.Group()
 
         self.score = 0
 
-        self.enemy_spawn_points = []
-        self.heart_spawn_points = []
-        self.collectibles_spawn_points = []
+        # spawn points of the entities and their respawn delays in seconds
+        self.player = None
+        self.enemy_spawns = SpawnRegistry(self.spawn_enemy, (4, 18))
+        self.heart_spawns = SpawnRegistry(self.spawn_heart, (8, 20))
+        self.collectible_spawns = SpawnRegistry(self.spawn_collectible, (10, 25))
+        self.streamer = None  # loads the level around the player, set in setup() when streaming
 
         # countdown timer
         self.countdown_time = 15
@@ -52,6 +118,8 @@ class Game:
         # load_game
         self.load_assets()
         self.setup()
+        if inputs or replay:
+            self.player.input_source = inputs or replay
 
         self.scroll -= self.player_pos
 
@@ -66,6 +134,9 @@ class Game:
         self.p_jump_img = import_image('Assety do gry', 'Player', 'Jump-sheet')
         self.p_attack_img = import_image('Assety do gry', 'Player', 'Attack-sheet')
         self.p_kick_img = import_image('Assety do gry', 'Player', 'KickPart')
+        # the kick is drawn at 0.6 of the frame scale, scaled once here instead of every drawn frame
+        self.p_kick_img = scale_world(self.p_kick_img, (int(self.p_kick_img.get_width() * SCALE * 0.6),
+                                                        int(self.p_kick_img.get_height() * SCALE * 0.6)))
         # player asset frames
         self.p_walk_frames = load_frames(self.p_walk_img, 5, 128, 128, 0.6)
         self.p_idle_frames = load_frames(self.p_idle_img, 4, 128, 128, 0.6)
@@ -107,6 +178,8 @@ class Game:
 
         # enemy projectile dict
         self.e_projectile = {'idle': self.e_Blood_Charge_1_frames}
+        self.projectile_pool = ProjectilePool(self.e_projectile, (self.all_sprites, self.projectiles, self.entities),
+                                              kinematics=self.kinematics)
 
         # hearts on map
         self.hp_hearts_img = import_image('Assety do gry', 'hp_hearts')
@@ -117,61 +190,52 @@ class Game:
         self.money_frames = load_frames(self.money_img, 6, 24, 24, 1.2)
         self.money = {'idle': self.money_frames}
 
+        # hearts, score and timer
+        self.hud = Hud(self.font, self.hp_hearts_frames)
+
     def attack_collision(self):
         """
         Ensures player attacks are colliding with the enemies
         """
         if self.player.attacking:
-            for sprite in self.entities:
-                if (hasattr(sprite, 'hitbox') and isinstance(sprite, Enemy) and getattr(sprite, 'can_collide', True)):
+            for sprite in self.entities.query(self.player.attack_hitbox):
+                if isinstance(sprite, Enemy) and sprite.can_collide:
                     if self.player.attack_hitbox.colliderect(sprite.hitbox):
                         sprite.can_collide = False
                         sprite.dead = True
                         sprite.state = 'dead'
                         sprite.frame_index = 0
                         self.score += sprite.value
-                        for spawn_data in self.enemy_spawn_points:
-                            if sprite.hitbox.colliderect(spawn_data['rect']):
-                                spawn_data['spawned'] = False
-                                spawn_data['timer'] = None
-                                self.start_countdown()
-                                break
+                        if self.enemy_spawns.release(sprite):
+                            self.start_countdown()
 
     def health_collision(self):
         """
         Ensures health pickups scattered around the map are being handled correctly
         """
-        for hp in list(self.health_pickups):  # Use list() to safely modify during iteration
-            if self.player.hitbox.colliderect(hp.rect):
+        for hp in self.entities.query(self.player.hitbox):
+            if isinstance(hp, Heart) and self.player.hitbox.colliderect(hp.rect):
                 if self.player.health < self.player.max_health:  # Only collect if not at max health
                     hp.collected = True
                     self.player.health += 1
-                    for spawn_data in self.heart_spawn_points:
-                        if hp.rect.colliderect(spawn_data['rect']):
-                            spawn_data['spawned'] = False
-                            spawn_data['timer'] = None
-                            break
+                    self.heart_spawns.release(hp)
 
     def collectible_collision(self):
         """
         Ensures collectibles pickups scattered around the map are being handled correctly
         """
-        for money in list(self.collectibles):
+        for money in self.entities.query(self.player.hitbox):
             if isinstance(money, Money) and self.player.hitbox.colliderect(money.rect):
                 if not money.collected:
                     money.collected = True
                     self.score += money.value
-                    for spawn_data in self.collectibles_spawn_points:
-                        if money.rect.colliderect(spawn_data['rect']):
-                            spawn_data['spawned'] = False
-                            spawn_data['timer'] = None
-                            break
+                    self.collectible_spawns.release(money)
 
     def take_damage(self):
         """
         Ensures player takes damages properly from enemy attacks (projectiles)
         """
-        for sprite in self.entities:
+        for sprite in self.entities.query(self.player.hitbox):
             if isinstance(sprite, Projectile):
                 if self.player.hitbox.colliderect(sprite.proj_hitbox):
                     if not hasattr(sprite, 'has_damaged_player'):
@@ -186,7 +250,7 @@ class Game:
         :param pos: position of the missle created - must be relatively close to enemy position
         :param direction: direction (and speed) of the projectile relative to the direction of an enemy
         """
-        Projectile(self.e_projectile, pos, direction, (self.all_sprites, self.projectiles, self.entities))
+        self.projectile_pool.spawn(pos, direction)
 
     def start_countdown(self):
         """
@@ -194,7 +258,7 @@ class Game:
         """
         self.countdown_time = 15
         if self.countdown_timer:
-            self.countdown_timer.deactivate()
+            self.countdown_timer.cancel()  # the replaced timer must not count down anymore
         self.countdown_timer = Timer(
             duration=1000,  # 1 second
             func=self.update_countdown,
@@ -214,208 +278,126 @@ class Game:
 
     def draw_ui(self):
         """
-        Drawing ui on the screen in real time
-        """
-        heart_size = (45, 45)
-        spacing = 0
-        start_pos = (0, 0)
-        max_hearts = self.player.max_health
-
-        for i in range(max_hearts):
-            # full heart (frame 0) for remaining HP, grey heart (frame 2) for lost HP
-            frame_index = 0 if i < self.player.health else 2
-            heart_img = pygame.transform.scale(self.hp_hearts_frames[frame_index], heart_size)
-            self.display_surface.blit(
-                heart_img,
-                (start_pos[0] + i * (heart_size[0] + spacing), start_pos[1])
-            )
-        score_text = f"Score: {self.score}"
-        text_surface = self.font.render(score_text, True, (0, 0, 0))
-        self.display_surface.blit(text_surface, (11, 41))
-        text_surface = self.font.render(score_text, True, (255, 215, 0))
-        self.display_surface.blit(text_surface, (10, 40))
-
-        timer_text = f"Time: {self.countdown_time // 60}:{self.countdown_time % 60:02d}"
-        if self.countdown_time >= 6:
-            timer_surface = self.font.render(timer_text, True, (0, 0, 0))
-            self.display_surface.blit(timer_surface, (11, 81))
-            timer_surface = self.font.render(timer_text, True, (255, 215, 0))
-            self.display_surface.blit(timer_surface, (10, 80))
-        else:
-            timer_surface = self.font.render(timer_text, True, (0, 0, 0))
-            self.display_surface.blit(timer_surface, (11, 81))
-            timer_surface = self.font.render(timer_text, True, (255, 0, 0))
-            self.display_surface.blit(timer_surface, (10, 80))
+        Drawing ui on the screen in real time (the hud is rendered again only when its values change)
+        """
+        if self.headless:
+            return
+        changed = self.hud.draw(self.display_surface, self.player.health, self.player.max_health, self.score,
+                                self.countdown_time)
+        if changed:
+            self.dirty_rects.add(changed)
+
+    def build_level(self, map_data):
+        """
+        Builds the static part of the level: map tiles baked into chunks and terrain collision rects
+        :param map_data: parsed map (support.import_map)
+        :return: static layer and collision grid
+        """
+        static_layer = ChunkedLayer(CHUNK_SIZE * self.render_scale, self.render_scale)
+        for image, pos in map_data['tiles']:
+            static_layer.add(image, pos)
+
+        # neighbouring solid tiles are merged into bigger rects, so collisions test a lot less rects
+        collision_grid = SpatialGrid(TILE_SIZE * SCALE)
+        tile_size = TILE_SIZE * SCALE
+        for x, y, width, height in merge_tiles(map_data['solid']):
+            collision_grid.insert(pygame.FRect(x * tile_size, y * tile_size, width * tile_size, height * tile_size))
+        return static_layer, collision_grid
 
     def setup(self):
         """
         Loading map tiles and placing the objects in the ingame world
         """
-        tmx_map = load_pygame(join('Assety do gry', 'maps', 'world.tmx'))
+        map_path = self.map_path
+        map_data = import_map(map_path)
 
-        self.map_width = tmx_map.width * tmx_map.tilewidth * SCALE
-        self.map_height = tmx_map.height * tmx_map.tileheight * SCALE
+        self.map_width = map_data['width']
+        self.map_height = map_data['height']
         self.map_bounds = pygame.Rect(0, 0, self.map_width, self.map_height)
 
-        # loading tiles with collisions
-        for x, y, image in tmx_map.get_layer_by_name('Main').tiles():
-            scaled_image = pygame.transform.scale(image, (TILE_SIZE * SCALE, TILE_SIZE * SCALE))
-            pixel_x = x * TILE_SIZE
-            pixel_y = y * TILE_SIZE
-            Sprite((pixel_x * SCALE, pixel_y * SCALE), scaled_image, (self.all_sprites, self.collision_sprites))
-        # loading decorative assets without collisions
-        for x, y, image in tmx_map.get_layer_by_name('Decorations').tiles():
-            scaled_image = pygame.transform.scale(image,
-                                                  (int(image.get_width() * SCALE), int(image.get_height() * SCALE)))
-            pixel_x = x * TILE_SIZE * SCALE
-            pixel_y = (y * TILE_SIZE * SCALE) - scaled_image.get_height() + TILE_SIZE * SCALE
-            Sprite((pixel_x, pixel_y), scaled_image, (self.all_sprites))
-        # loading entities such as player, enemies and pickups
-        for obj in tmx_map.get_layer_by_name('Entities'):
+        # static layers only depend on the map file, so they are built once and reused on restart
+        self.all_sprites.static_layer, self.collision_grid = get_asset(('level', map_path, self.render_scale),
+                                                                       lambda: self.build_level(map_data))
+        # loading entities such as player, enemies and pickups, when streaming they are spawned
+        # when their chunk gets loaded
+        suspended = self.stream_distance is not None
+        for obj in map_data['entities']:
             if obj.name == 'Player':
                 self.player = Player((obj.x * SCALE, obj.y * SCALE), (self.all_sprites, self.entities),
-                                     self.collision_sprites, self.entities, self.p_animations)
+                                     self.collision_grid, self.entities, self.p_animations)
                 self.player_pos = obj.x
             elif obj.name == 'Enemy':
-                spawn_rect = pygame.FRect(obj.x * SCALE, obj.y * SCALE, obj.width * SCALE, obj.height * SCALE)
-                spawn_data = {
-                    'rect': spawn_rect,
-                    'spawned': True,
-                    'timer': None
-                }
-                self.enemy_spawn_points.append(spawn_data)
-                Enemy(pygame.FRect(obj.x * SCALE, obj.y * SCALE, obj.width * SCALE, obj.height * SCALE),
-                      (self.all_sprites, self.entities), self.collision_sprites, self.entities, self.e_animations,
-                      self.create_projectile)
+                self.enemy_spawns.add(
+                    pygame.FRect(obj.x * SCALE, obj.y * SCALE, obj.width * SCALE, obj.height * SCALE),
+                    suspended=suspended)
             elif obj.name == 'Health':
-                spawn_rect = pygame.FRect(obj.x * SCALE, obj.y * SCALE, obj.width * SCALE, obj.height * SCALE)
-                spawn_data = {
-                    'rect': spawn_rect,
-                    'spawned': True,
-                    'timer': None
-                }
-                self.heart_spawn_points.append(spawn_data)
-                Heart((obj.x * SCALE, obj.y * SCALE),
-                      self.hp_hearts_frames[0],
-                      (self.all_sprites, self.entities, self.health_pickups))
+                self.heart_spawns.add(
+                    pygame.FRect(obj.x * SCALE, obj.y * SCALE, obj.width * SCALE, obj.height * SCALE),
+                    suspended=suspended)
             elif obj.name == 'Objective':
-                spawn_rect = pygame.FRect(obj.x * SCALE, obj.y * SCALE, obj.width * SCALE, obj.height * SCALE)
-                spawn_data = {
-                    'rect': spawn_rect,
-                    'spawned': True,
-                    'timer': None,
-                    'value': 100
-                }
-                self.collectibles_spawn_points.append(spawn_data)
-                Money(self.money,
-                      (obj.x * SCALE, obj.y * SCALE),
-                      (self.all_sprites, self.entities, self.collectibles))
+                self.collectible_spawns.add(
+                    pygame.FRect(obj.x * SCALE, obj.y * SCALE, obj.width * SCALE, obj.height * SCALE), 100,
+                    suspended=suspended)
         # ensuring player bounds
         self.player.map_bounds = self.map_bounds
+        # enemies created before the player was found in the map get the reference now
+        for sprite in self.entities:
+            if isinstance(sprite, Enemy):
+                sprite.player = self.player
+        if suspended:
+            self.streamer = WorldStreamer(self.all_sprites.static_layer,
+                                          (self.enemy_spawns, self.heart_spawns, self.collectible_spawns),
+                                          self.stream_distance, render=self.all_sprites.render)
+            self.streamer.update(self.player.rect.center)
 
     def handle_respawns(self):
         """
-        Respawning enemies and collectibles
-        Checks for spawn areas for the entity and if there is an entity already spawned there.
-        If not, it fires up a timer counting down and after that it spawns the desired entity
-        """
-        # enemy respawns
-        for spawn_data in self.enemy_spawn_points:
-            if not spawn_data['spawned']:
-                if spawn_data['timer'] is None:
-                    spawn_data['timer'] = Timer(
-                        duration=randint(4, 18) * 1000,
-                        func=lambda rect=spawn_data['rect']: self.respawn_enemy(rect),
-                        repeat=False,
-                        autostart=True
-                    )
-                if spawn_data['timer']:
-                    spawn_data['timer'].update()
-        # heart respawns
-        for spawn_data in self.heart_spawn_points:
-            if not spawn_data['spawned']:
-                if spawn_data['timer'] is None:
-                    spawn_data['timer'] = Timer(
-                        duration=randint(8, 20) * 1000,
-                        func=lambda rect=spawn_data['rect']: self.respawn_heart(rect),
-                        repeat=False,
-                        autostart=True
-                    )
-                if spawn_data['timer']:
-                    spawn_data['timer'].update()
-
-        for spawn_data in self.collectibles_spawn_points:
-            if not spawn_data['spawned']:
-                if spawn_data['timer'] is None:
-                    spawn_data['timer'] = Timer(
-                        duration=randint(10, 25) * 1000,
-                        func=lambda rect=spawn_data['rect'], value=spawn_data['value']:
-                        self.respawn_collectibles(rect, value),
-                        repeat=False,
-                        autostart=True
-                    )
-                if spawn_data['timer']:
-                    spawn_data['timer'].update()
-
-    def respawn_enemy(self, rect):
+        Respawning enemies and collectibles.
+        Every freed spawn point fires up a timer counting down and after that it spawns the desired entity
+        """
+        self.enemy_spawns.update()
+        self.heart_spawns.update()
+        self.collectible_spawns.update()
+
+    def spawn_enemy(self, rect, data=None):
         """
         Creates an instance of Enemy class in the map
         :param rect: location of the entity
         """
-        Enemy(rect,
-              (self.all_sprites, self.entities), self.collision_sprites, self.entities, self.e_animations,
-              self.create_projectile)
+        return Enemy(rect,
+                     (self.all_sprites, self.entities), self.collision_grid, self.entities, self.e_animations,
+                     self.create_projectile, self.player)
 
-        for spawn_data in self.enemy_spawn_points:
-            if spawn_data['rect'] == rect:
-                spawn_data['spawned'] = True
-                spawn_data['timer'] = None
-                break
-
-    def respawn_heart(self, rect):
+    def spawn_heart(self, rect, data=None):
         """
         Creates an instance of Heart class in the map
         :param rect: location of the entity
         """
-        Heart((rect.x, rect.y),
-              self.hp_hearts_frames[0],
-              (self.all_sprites, self.entities, self.health_pickups))
-
-        for spawn_data in self.heart_spawn_points:
-            if spawn_data['rect'] == rect:
-                spawn_data['spawned'] = True
-                spawn_data['timer'] = None
-                break
+        return Heart((rect.x, rect.y),
+                     self.hp_hearts_frames[0],
+                     (self.all_sprites, self.entities, self.health_pickups))
 
-    def respawn_collectibles(self, rect, value):
+    def spawn_collectible(self, rect, value):
         """
         Creates an instance of collectible Money class in the map
-        :param value: value of the collectible
         :param rect: location of the entity
+        :param value: value of the collectible
         """
         money = Money(self.money,
                       (rect.x, rect.y),
                       (self.all_sprites, self.entities, self.collectibles))
         money.value = value
-
-        for spawn_data in self.collectibles_spawn_points:
-            if spawn_data['rect'] == rect:
-                spawn_data['spawned'] = True
-                spawn_data['timer'] = None
-                break
+        return money
 
     def scroll_background(self, unupdated_x):
         """
         Handles scrolling of the dynamic 2d background
         :param unupdated_x: takes an x's old position and returns a new position to scroll the background
         """
-        for x in range(5):  # times the background is redrawn
-            self.speed = 1
-            for i in self.bg_images:
-                self.display_surface.blit(i, ((x * self.bg_width) + self.scroll * self.speed, 0))
-                self.speed += 0.2
-
-        updated_x = self.player.rect.x - unupdated_x
+        self.background.draw(self.all_sprites.target, self.scroll)
+        if self.scroll != self.drawn_scroll:
+            self.dirty_rects.invalidate()
+            self.drawn_scroll = self.scroll
 
         updated_x = self.player.rect.x - unupdated_x
         if self.all_sprites.centered_camera:
@@ -424,48 +406,191 @@ class Game:
             elif updated_x > 0:
                 self.scroll -= 5
 
+    def update_world(self, dt):
+        """
+        One fixed simulation step: sprites, collisions, respawns and the countdown
+        :param dt: simulation step in seconds
+        """
+        if self.streamer:
+            with profiler.scope('streaming'):
+                self.streamer.update(self.player.rect.center)
+        with profiler.scope('update'):
+            scheduler.update()  # fires the timers that ran out (cooldowns, projectile lifetime, countdown, respawns)
+            self.all_sprites.update(dt)
+            if self.projectile_pool.kinematics:
+                self.projectile_pool.kinematics.step(dt)
+        with profiler.scope('collision'):
+            with profiler.scope('broad phase'):
+                self.entities.refresh()
+            with profiler.scope('attack collision'):
+                self.attack_collision()
+            with profiler.scope('health collision'):
+                self.health_collision()
+            with profiler.scope('collectible collision'):
+                self.collectible_collision()
+            with profiler.scope('take damage'):
+                self.take_damage()
+        with profiler.scope('respawn'):
+            self.handle_respawns()
+        self.sim_ticks += dt * 1000
+        if self.replay:
+            self.replay.tick(self)
+
+    def draw_world(self, unupdated_x, alpha=1):
+        """
+        Renders the background, the world and the ui
+        :param unupdated_x: player x position before this frame's simulation steps
+        :param alpha: interpolation between the last two simulation states (1 = latest state)
+        """
+        with profiler.scope('draw'):
+            with profiler.scope('background'):
+                self.scroll_background(unupdated_x)
+            camera_target = self.all_sprites.interpolate(self.player, alpha) + (
+                pygame.Vector2(self.player.rect.center) - self.player.rect.topleft)
+            self.all_sprites.draw(camera_target, self.map_width, self.map_height, alpha)
+            if self.all_sprites.camera_moved:
+                self.dirty_rects.invalidate()
+            else:
+                self.dirty_rects.add_all(self.all_sprites.dirty)
+        with profiler.scope('ui'):
+            self.draw_ui()
+
+    def handle_profiler_keys(self, event):
+        """
+        F3 toggles the profiler overlay, F4 starts/stops recording a Chrome trace (saved as PROFILER_TRACE)
+        """
+        if event.key == pygame.K_F3:
+            profiler.toggle()
+            self.dirty_rects.invalidate()  # the overlay shows up or disappears
+        elif event.key == pygame.K_F4:
+            if profiler.trace_events is None:
+                profiler.start_trace()
+            else:
+                profiler.save_trace()
+
     def run(self):
         """
-        Main function for running the game
+        Main function for running the game.
+        The world is simulated in fixed SIMULATION_STEP updates and rendered once per frame
+        in between the last two simulation states
         """
+        accumulator = 0
         while self.running:
-            dt = self.clock.tick(FRAMERATE) / 1000
+            frame_time = self.clock.tick(FRAMERATE) / 1000
             if not self.player_dead and not self.game_over_screen:
                 unupdated_x = self.player.rect.x
-                self.all_sprites.update(dt)
-                self.scroll_background(unupdated_x)
-                self.all_sprites.draw(self.player.rect.center, self.map_width, self.map_height)
-                self.attack_collision()
-                self.health_collision()
-                self.collectible_collision()
-                self.take_damage()
-                self.draw_ui()
-                self.handle_respawns()
-                if self.countdown_timer:
-                    self.countdown_timer.update()
+                accumulator += frame_time
+                steps = 0
+                while accumulator >= SIMULATION_STEP and steps < MAX_SIMULATION_STEPS and not self.player_dead:
+                    self.update_world(SIMULATION_STEP)
+                    accumulator -= SIMULATION_STEP
+                    steps += 1
+                if steps == MAX_SIMULATION_STEPS:
+                    # too slow to catch up, drop the rest of the stall instead of piling up more updates
+                    accumulator = min(accumulator, SIMULATION_STEP)
+                self.draw_world(unupdated_x, accumulator / SIMULATION_STEP)
+                if profiler.visible:
+                    profiler.draw(self.display_surface)
+                    self.dirty_rects.invalidate()
+                profiler.end_frame()
             elif self.player_dead and not self.game_over_screen:
                 self.game_over_screen = GameOver(self.display_surface, self.score)
 
             if self.game_over_screen:
-                self.game_over_screen.draw()
+                self.dirty_rects.add_all(self.game_over_screen.draw())
 
                 if self.game_over_screen and event.type == pygame.MOUSEBUTTONDOWN:
                     action = self.game_over_screen.handle_event(event)
                     if action == "restart":
-                        self.__init__()
+                        self.restart()
                         self.game_over_screen = None
+                        accumulator = 0
                     elif action == "quit":
                         self.running = False
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     self.running = False
+                if event.type == pygame.KEYDOWN:
+                    self.handle_profiler_keys(event)
 
-            pygame.display.update()
+            # only the changed areas of the screen
+            self.dirty_rects.update()
 
         pygame.quit()
 
+    def restart(self):
+        """
+        Starts a new game with the same constructor arguments and seed. A recording or replay covers one game,
+        it ends with the game over and the restarted game is played without it
+        """
+        if isinstance(self.replay, Recorder):
+            print('Recording ended with the game over, the restarted game is not recorded')
+        elif self.replay:
+            print('Replay ended with the game over')
+        self.__init__(**{**self.options, 'replay': None})
+
+    def run_headless(self, steps):
+        """
+        Simulates the game as fast as possible, without rendering and without waiting for real time
+        :param steps: number of SIMULATION_STEP updates to run (stops earlier if the player dies)
+        :return: dict with simulated steps, wall-clock seconds and simulated steps per wall-clock second
+        """
+        start = perf_counter()
+        done = 0
+        while done < steps and not self.player_dead:
+            self.update_world(SIMULATION_STEP)
+            profiler.end_frame()
+            done += 1
+        seconds = perf_counter() - start
+        return {
+            'steps': done,
+            'seconds': seconds,
+            'steps_per_second': done / seconds if seconds else 0,
+            'player_dead': self.player_dead
+        }
+
 
 if __name__ == '__main__':
-    game = Game()
-    game.run()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--headless', type=int, metavar='STEPS',
+                        help='simulate STEPS updates without a window, with the demo input script')
+    parser.add_argument('--trace', metavar='PATH', help='record a Chrome trace of the whole run into PATH')
+    parser.add_argument('--kinematics', choices=['python', 'numpy'], default=KINEMATICS,
+                        help='projectile movement backend')
+    parser.add_argument('--low-res', action='store_true', default=LOW_RES,
+                        help='draw the world at the native pixel art resolution, upscaled once per frame')
+    parser.add_argument('--seed', type=int, help='random seed, a recorded game gets a random one if not set')
+    parser.add_argument('--record', metavar='PATH',
+                        help='record the game until its game over (seed, input, world checksums) into PATH')
+    parser.add_argument('--replay', metavar='PATH', help='replay a recorded game headless and check it plays the same')
+    args = parser.parse_args()
+
+    if args.trace:
+        profiler.start_trace()
+    seed = args.seed
+    if seed is None and args.record:
+        seed = random.randrange(2 ** 32)
+    recorder = Recorder(ScriptedInput(DEMO_SCRIPT) if args.headless else None) if args.record else None
+    if args.replay:
+        replay = load_replay(args.replay)
+        game, player = replay_game(replay)
+        stats = game.run_headless(replay['steps'])
+        print(f"{stats['steps']} of {replay['steps']} steps in {stats['seconds']:.2f} s, " +
+              (f'diverged at step {player.diverged}' if player.diverged else 'same world state as recorded'))
+        if player.diverged:
+            raise SystemExit(1)
+    elif args.headless:
+        game = Game(headless=True, inputs=None if recorder else ScriptedInput(DEMO_SCRIPT), kinematics=args.kinematics,
+                    seed=seed, replay=recorder)
+        stats = game.run_headless(args.headless)
+        print(f"{stats['steps']} steps in {stats['seconds']:.2f} s: "
+              f"{stats['steps_per_second']:.0f} simulated steps/s "
+              f"({stats['steps_per_second'] / SIMULATION_RATE:.1f}x real time)")
+    else:
+        game = Game(kinematics=args.kinematics, seed=seed, replay=recorder, low_res=args.low_res)
+        game.run()
+    if recorder:
+        recorder.save(args.record)
+    if args.trace:
+        profiler.save_trace(args.trace)
@@ -0,0 +1,80 @@
+from math import ceil
+from settings import *
+
+
+class ParallaxBackground:
+    """
+    Scrolling background made of layers repeating horizontally, each moving at its own speed.
+    Only the copies of a layer that are on the screen are drawn, wherever the scroll is
+    """
+
+    def __init__(self, layers, speeds, cached_layers=0, scale=1):
+        """
+        :param layers: layer surfaces from the farthest to the nearest, the farthest one opaque
+        :param speeds: scroll multiplier of every layer
+        :param cached_layers: how many of the far layers are pre-composited into one cached screen strip,
+        composited again only when the scroll moves (0 = every layer is drawn every frame)
+        :param scale: render scale, the layers are that many times smaller than the window (see AllSprites)
+        """
+        self.layers = layers
+        self.speeds = speeds
+        self.cached_layers = cached_layers
+        self.scale = scale
+        self.width = layers[0].get_width()
+        self.view_width = ceil(WINDOW_WIDTH / scale)  # width of the surface drawn on
+
+        # what is actually blitted: fully opaque layers without alpha (a plain copy instead of blending),
+        # the others cut down to the part that is not fully transparent
+        self.images = []
+        for layer in layers:
+            width, height = layer.get_size()
+            if pygame.mask.from_surface(layer, 254).count() == width * height:
+                self.images.append((layer.convert(), (0, 0)))
+            else:
+                bounds = layer.get_bounding_rect()
+                self.images.append((layer.subsurface(bounds), bounds.topleft))
+
+        self.cache = None  # far layers composited for cache_scroll
+        self.cache_scroll = None
+        self.blits = 0  # blits done in the last draw
+
+    def positions(self, layer, scroll):
+        """
+        :param layer: layer index
+        :param scroll: background scroll
+        :return: x positions of the layer copies that intersect the screen
+        """
+        offset = scroll * self.speeds[layer] / self.scale
+        # first copy reaching into the screen, the position is computed as copy * width + offset
+        # for every copy, so it is the same number the copies had when they were placed in a fixed row
+        copy = int((-offset) // self.width)
+        positions = []
+        while copy * self.width + offset < self.view_width:
+            positions.append(copy * self.width + offset)
+            copy += 1
+        return positions
+
+    def draw_layers(self, surface, layers, scroll):
+        for layer in layers:
+            image, (left, top) = self.images[layer]
+            for x in self.positions(layer, scroll):
+                # truncated like blit truncates the position of the whole layer
+                surface.blit(image, (int(x) + left, top))
+                self.blits += 1
+
+    def draw(self, surface, scroll):
+        """
+        :param surface: surface to draw on
+        :param scroll: background scroll in world units (0 = layers start at the left edge of the screen)
+        """
+        self.blits = 0
+        if self.cached_layers:
+            if self.cache_scroll != scroll:
+                if not self.cache:
+                    # the farthest layer covers the whole strip, the cache needs no alpha
+                    self.cache = pygame.Surface((self.view_width, self.layers[0].get_height())).convert()
+                self.draw_layers(self.cache, range(self.cached_layers), scroll)
+                self.cache_scroll = scroll
+            surface.blit(self.cache, (0, 0))
+            self.blits += 1
+        self.draw_layers(surface, range(self.cached_layers, len(self.layers)), scroll)
@@ -0,0 +1,69 @@
+from settings import *
+from sprites import Projectile
+from kinematics import ProjectileKinematics, np
+
+
+class ProjectilePool:
+    """
+    Fixed number of enemy projectiles created once and reused,
+    instead of creating a new projectile (with its timer and rects) for every enemy attack
+    """
+
+    def __init__(self, animation, groups, capacity=PROJECTILE_POOL_SIZE, kinematics=KINEMATICS):
+        """
+        :param animation: projectile animation frames
+        :param groups: groups a spawned projectile is added to
+        :param capacity: number of projectiles in the pool
+        :param kinematics: 'python' = every projectile moves in its own update,
+        'numpy' = all of them are moved together by ProjectileKinematics.step (if NumPy is installed)
+        """
+        self.groups = groups
+        self.projectiles = [Projectile(animation, (0, 0), 1, (), self) for _ in range(capacity)]
+        for slot, projectile in enumerate(self.projectiles):
+            projectile.slot = slot
+        self.free = self.projectiles[::-1]
+        self.kinematics = ProjectileKinematics(self.projectiles) if kinematics == 'numpy' and np else None
+        self.live = {}  # projectiles in the game, in spawn order (dict as an ordered set)
+        self.high_water = 0  # most projectiles live at the same time
+        self.spawned = 0
+        self.evicted = 0  # projectiles taken back before they expired, because the pool was empty
+
+    def spawn(self, pos, direction):
+        """
+        :param pos: top left position of the projectile
+        :param direction: -1 = flying left, 1 = flying right
+        :return: projectile from the pool, the oldest live one is reused when no projectile is free
+        """
+        if self.free:
+            projectile = self.free.pop()
+        else:
+            projectile = next(iter(self.live))
+            del self.live[projectile]
+            if self.kinematics:
+                self.kinematics.remove(projectile)
+            projectile.remove(*projectile.groups())
+            self.evicted += 1
+        projectile.reset(pos, direction)
+        projectile.kill_proj.activate()
+        projectile.add(*self.groups)
+        if self.kinematics:
+            self.kinematics.add(projectile)
+        self.live[projectile] = None
+        self.spawned += 1
+        self.high_water = max(self.high_water, len(self.live))
+        return projectile
+
+    def release(self, projectile):
+        """
+        Gives a killed projectile back to the pool (killing it again does nothing)
+        """
+        if projectile in self.live:
+            del self.live[projectile]
+            self.free.append(projectile)
+            projectile.kill_proj.cancel()  # a projectile in the pool has no timer waiting
+            if self.kinematics:
+                self.kinematics.remove(projectile)
+
+    def stats(self):
+        return {'live': len(self.live), 'free': len(self.free), 'high_water': self.high_water,
+                'spawned': self.spawned, 'evicted': self.evicted}
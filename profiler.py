@@ -0,0 +1,150 @@
+import json
+from collections import deque
+from time import perf_counter
+import pygame
+from settings import *
+
+
+class Scope:
+    def __init__(self, profiler, name):
+        """
+        Times one run of a named block of code, used as: with profiler.scope('name'):
+        :param profiler: profiler collecting the time
+        :param name: scope name
+        """
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, self.start, perf_counter())
+        return False
+
+
+class NullScope:
+    # shared do-nothing scope returned while the profiler is disabled
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SCOPE = NullScope()
+
+
+class Profiler:
+    def __init__(self, history=PROFILER_HISTORY):
+        """
+        Collects time spent in named scopes per frame, keeps rolling averages and p99,
+        draws them in an overlay and records Chrome trace events (chrome://tracing, Perfetto)
+        :param history: number of frames the rolling statistics are computed from
+        """
+        self.enabled = False  # scopes are timed (overlay shown or trace recorded)
+        self.visible = False  # overlay shown
+        self.history = history
+        self.current = {}  # scope name -> ms spent in it in the current frame
+        self.last_frame = {}  # the same for the last finished frame
+        self.samples = {}  # scope name -> per frame ms of the last `history` frames
+        self.trace_events = None  # list of trace events while recording a trace
+        self.origin = perf_counter()
+        self.font = None
+
+    def scope(self, name):
+        """
+        :param name: scope name, scopes with the same name are summed up per frame
+        :return: context manager timing the block (does nothing while disabled)
+        """
+        if not self.enabled:
+            return NULL_SCOPE
+        return Scope(self, name)
+
+    def add(self, name, start, end):
+        self.current[name] = self.current.get(name, 0) + (end - start) * 1000
+        if self.trace_events is not None:
+            self.trace_events.append({'name': name, 'ph': 'X', 'pid': 0, 'tid': 0,
+                                      'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6})
+
+    def end_frame(self):
+        """
+        Closes the current frame, its scope times go into the rolling statistics
+        """
+        if not self.enabled:
+            return
+        for name, ms in self.current.items():
+            if name not in self.samples:
+                self.samples[name] = deque(maxlen=self.history)
+            self.samples[name].append(ms)
+        self.last_frame = self.current
+        self.current = {}
+
+    def stats(self):
+        """
+        :return: dict scope name -> {'avg': ms, 'p99': ms} over the rolling history
+        """
+        result = {}
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            result[name] = {'avg': sum(ordered) / len(ordered),
+                            'p99': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]}
+        return result
+
+    def toggle(self):
+        # shows or hides the overlay, a trace being recorded keeps timing the scopes
+        self.visible = not self.visible
+        self.enabled = self.visible or self.trace_events is not None
+        if not self.visible:
+            self.samples.clear()
+            self.current.clear()
+
+    def start_trace(self):
+        # times the scopes while recording, without showing the overlay
+        self.enabled = True
+        self.trace_events = []
+
+    def save_trace(self, path=PROFILER_TRACE):
+        """
+        Stops recording and writes the recorded events as a Chrome trace JSON file
+        :param path: output file
+        """
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': self.trace_events or [], 'displayTimeUnit': 'ms'}, file)
+        self.trace_events = None
+        self.enabled = self.visible
+        if not self.visible:
+            self.samples.clear()
+            self.current.clear()
+
+    def draw(self, surface):
+        """
+        Overlay with the average and p99 time of every scope in the top right corner
+        :param surface: surface to draw on
+        """
+        if not self.visible:
+            return
+        if not self.font:
+            self.font = pygame.font.Font('dogicapixel.ttf', 12)
+        rows = [('scope', 'avg ms', 'p99 ms')]
+        for name, stats in sorted(self.stats().items(), key=lambda item: -item[1]['avg']):
+            rows.append((name, f'{stats["avg"]:.2f}', f'{stats["p99"]:.2f}'))
+        line_height = self.font.get_linesize() + 4
+        name_width = max(self.font.size(row[0])[0] for row in rows)
+        column_width = 80
+        width = name_width + column_width * 2 + 15
+        overlay = pygame.Surface((width, line_height * len(rows) + 10), pygame.SRCALPHA)
+        overlay.fill((0, 0, 0, 170))
+        for i, row in enumerate(rows):
+            y = 5 + i * line_height
+            overlay.blit(self.font.render(row[0], True, (255, 255, 255)), (5, y))
+            for column, text in enumerate(row[1:], start=1):
+                text_surface = self.font.render(text, True, (255, 255, 255))
+                overlay.blit(text_surface, (5 + name_width + column_width * column - text_surface.get_width(), y))
+        surface.blit(overlay, (WINDOW_WIDTH - width, 0))
+
+
+# shared profiler for the whole game (F3 in game shows the overlay, F4 records a trace)
+profiler = Profiler()
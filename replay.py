@@ -0,0 +1,135 @@
+"""
+Recording and replaying game sessions. A replay file holds the random seed, the level settings and the game keys
+of every simulation step (run-length encoded, like the ScriptedInput scripts), plus a checksum of the world state
+every REPLAY_CHECKSUM_INTERVAL steps, so a replay shows where it stopped matching the recorded session.
+    python main.py --record session.replay      records a game (ends with the game over)
+    python main.py --replay session.replay      replays it headless
+    python benchmark.py replay --replay session.replay
+"""
+import json
+import zlib
+import pygame
+from settings import *
+from inputs import ScriptedInput
+
+REPLAY_VERSION = 1
+GAME_KEYS = (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_SPACE)  # the only keys the game reads
+
+
+def world_checksum(game):
+    """
+    :return: CRC32 of the player, score, countdown and the positions of every entity in the game
+    """
+    player = game.player
+    state = [tuple(player.rect), player.health, game.score, game.countdown_time]
+    state += sorted((type(sprite).__name__, sprite.rect.x, sprite.rect.y) for sprite in game.entities)
+    return zlib.crc32(repr(state).encode())
+
+
+class Recorder:
+    """
+    Input source recording the game keys it returns, one call per simulation step.
+    Game calls tick() after every step (Game(replay=recorder)), which saves the world checksums
+    """
+
+    def __init__(self, source=None, interval=REPLAY_CHECKSUM_INTERVAL):
+        """
+        :param source: input source to record, pygame.key.get_pressed if None
+        :param interval: simulation steps between two world checksums
+        """
+        self.source = source or pygame.key.get_pressed
+        self.interval = interval
+        self.script = []  # [steps, keys held down]
+        self.checksums = []
+        self.steps = 0
+        self.settings = None  # seed and level settings of the recorded game
+
+    def __call__(self):
+        keys = self.source()
+        pressed = [key for key in GAME_KEYS if keys[key]]
+        if self.script and self.script[-1][1] == pressed:
+            self.script[-1][0] += 1
+        else:
+            self.script.append([1, pressed])
+        return keys
+
+    def tick(self, game):
+        if self.settings is None:
+            # taken at the first step, a restarted game is not recorded anymore
+            self.settings = {
+                'seed': game.seed,
+                'map': game.map_path,
+                'kinematics': game.kinematics,
+                'stream_distance': game.stream_distance
+            }
+        self.steps += 1
+        if self.steps % self.interval == 0:
+            self.checksums.append(world_checksum(game))
+
+    def save(self, path):
+        """
+        Writes the replay file
+        """
+        data = {
+            'version': REPLAY_VERSION,
+            **(self.settings or {}),
+            'steps': self.steps,
+            'interval': self.interval,
+            'script': self.script,
+            'checksums': self.checksums
+        }
+        with open(path, 'w') as file:
+            json.dump(data, file, separators=(',', ':'))
+
+
+class ReplayPlayer:
+    """
+    Input source playing the keys of a replay back and comparing the world checksums with the recorded ones
+    """
+
+    def __init__(self, replay):
+        """
+        :param replay: loaded replay (load_replay)
+        """
+        self.replay = replay
+        self.inputs = ScriptedInput(replay['script'], repeat=False)
+        self.interval = replay['interval']
+        self.checksums = replay['checksums']
+        self.steps = 0
+        self.diverged = None  # first step with a different world checksum
+
+    def __call__(self):
+        return self.inputs()
+
+    def tick(self, game):
+        self.steps += 1
+        if self.steps % self.interval == 0 and self.diverged is None:
+            index = self.steps // self.interval - 1
+            if index < len(self.checksums) and world_checksum(game) != self.checksums[index]:
+                self.diverged = self.steps
+
+
+def load_replay(path):
+    """
+    :return: replay data (see Recorder.save)
+    """
+    with open(path) as file:
+        replay = json.load(file)
+    if replay.get('version') != REPLAY_VERSION:
+        raise ValueError(f'{path}: unsupported replay version {replay.get("version")}')
+    return replay
+
+
+def replay_game(replay, **kwargs):
+    """
+    Creates a headless game set up like the recorded one, fed by the replay
+    :param replay: loaded replay (load_replay)
+    :param kwargs: other Game arguments
+    :return: (game, replay player)
+    """
+    from main import Game
+
+    player = ReplayPlayer(replay)
+    game = Game(headless=True, map_path=replay['map'], kinematics=replay['kinematics'],
+                stream_distance=replay['stream_distance'], seed=replay['seed'], replay=player, **kwargs)
+    return game, player
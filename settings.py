@@ -8,7 +8,29 @@ WINDOW_WIDTH = 1000
 WINDOW_HEIGHT = 600
 TILE_SIZE = 32
 FRAMERATE = 60
+SIMULATION_RATE = 120  # fixed simulation updates per second, independent of the rendering framerate
+SIMULATION_STEP = 1 / SIMULATION_RATE
+MAX_SIMULATION_STEPS = 8  # max updates per rendered frame, the rest of a long stall is dropped
 BG_COLOR = '#b59588'
+CHUNK_SIZE = 512  # size of baked static map chunks in pixels
+STREAM_DISTANCE = 1024  # chunks this far (px) outside of the screen are loaded, None loads the whole level
+WORLD_MAP = join('Assety do gry', 'maps', 'world.tmx')
+ASSET_PACK = 'assets.pack'  # baked assets, built with: python assetpack.py
+ENTITY_CELL_SIZE = 256  # cell size of the per step entity grid (player vs entity checks)
+TEXTURE_ATLAS = False  # pack animation frames and map tiles into a few big surfaces (python benchmark.py atlas)
+ATLAS_PAGE_SIZE = 1024  # width and height of a texture atlas page in pixels
+LOW_RES = False  # draw the world at the native pixel art resolution and upscale it once (python benchmark.py lowres)
+DIRTY_RECTS = True  # update only the changed areas of the window (python benchmark.py dirty)
+DIRTY_MAX_COVERAGE = 0.5  # changed areas covering more of the screen than this update the whole window
+LAYER_MAIN = 0  # render layers, drawn from the lowest: enemies, pickups, projectiles
+LAYER_PLAYER = 1  # the player and the kick on top of everything
+CULL_MARGIN = 64  # sprites further than this outside of the screen are not drawn
+PARALLAX_CACHED_LAYERS = 0  # far background layers pre-composited into one cached strip (python benchmark.py parallax)
+PROJECTILE_POOL_SIZE = 64  # enemy projectiles created up front and reused
+KINEMATICS = 'python'  # 'numpy' moves pooled projectiles with array operations (needs numpy)
+REPLAY_CHECKSUM_INTERVAL = 60  # simulation steps between two world checksums in replay files
+PROFILER_HISTORY = 240  # frames used for the profiler overlay averages
+PROFILER_TRACE = 'trace.json'  # Chrome trace file written by the profiler
 
 JUMP_HEIGHT = 11 * SCALE
 SPEED = 200 * SCALE
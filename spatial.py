@@ -0,0 +1,193 @@
+from math import ceil, floor
+
+
+def cell_range(size, left, top, right, bottom):
+    """
+    :return: (first column, first row, last column, last row) of the grid cells an area overlaps
+    """
+    # right/bottom edges are exclusive, same as colliderect
+    return (floor(left / size), floor(top / size),
+            ceil(right / size) - 1, ceil(bottom / size) - 1)
+
+
+class SpatialGrid:
+    """
+    Uniform grid index over static rectangles (terrain).
+    Collision code asks only for the rects in the cells around a hitbox
+    instead of looping over every tile of the map
+    """
+
+    def __init__(self, cell_size):
+        """
+        :param cell_size: width and height of one grid cell in pixels (TILE_SIZE * SCALE)
+        """
+        self.cell_size = cell_size
+        self.cells = {}  # (column, row) -> list of indexes into self.rects
+        self.rects = []  # every inserted rect, in insertion order
+
+    def __len__(self):
+        return len(self.rects)
+
+    def __iter__(self):
+        return iter(self.rects)
+
+    def _cell_range(self, left, top, right, bottom):
+        return cell_range(self.cell_size, left, top, right, bottom)
+
+    def insert(self, rect):
+        """
+        Adds a rect to every cell it overlaps
+        :param rect: static pygame Rect/FRect
+        """
+        index = len(self.rects)
+        self.rects.append(rect)
+        col_start, row_start, col_end, row_end = self._cell_range(rect.left, rect.top, rect.right, rect.bottom)
+        for col in range(col_start, col_end + 1):
+            for row in range(row_start, row_end + 1):
+                self.cells.setdefault((col, row), []).append(index)
+
+    def query(self, rect):
+        """
+        Returns the rects that may collide with the given hitbox.
+        The searched area is the hitbox grown by its own size on every side, because
+        resolving a collision can push the hitbox by up to its own width/height.
+        Results keep the insertion order, so resolving collisions gives the same result
+        as a linear scan over all rects
+        :param rect: hitbox to search around
+        :return: list of candidate rects
+        """
+        width, height = rect.width, rect.height
+        col_start, row_start, col_end, row_end = self._cell_range(rect.left - width, rect.top - height,
+                                                                  rect.right + width, rect.bottom + height)
+        cells = self.cells
+        found = set()
+        for col in range(col_start, col_end + 1):
+            for row in range(row_start, row_end + 1):
+                indexes = cells.get((col, row))
+                if indexes:
+                    found.update(indexes)
+        rects = self.rects
+        return [rects[i] for i in sorted(found)]
+
+
+def merge_tiles(tiles):
+    """
+    Greedy merge of solid tiles into large axis-aligned rectangles.
+    Each row is split into runs of neighbouring tiles, then every run is grown downwards
+    for as long as the rows below have the same (still unused) run
+    :param tiles: iterable of (x, y) tile coordinates
+    :return: list of (x, y, width, height) rectangles in tile units
+    """
+    solid = set(tiles)
+    used = set()
+    rects = []
+    for x, y in sorted(solid, key=lambda tile: (tile[1], tile[0])):
+        if (x, y) in used:
+            continue
+        width = 1
+        while (x + width, y) in solid and (x + width, y) not in used:
+            width += 1
+        height = 1
+        while all((x + i, y + height) in solid and (x + i, y + height) not in used for i in range(width)):
+            height += 1
+        for i in range(width):
+            for j in range(height):
+                used.add((x + i, y + j))
+        rects.append((x, y, width, height))
+    return rects
+
+
+class DynamicGrid:
+    """
+    Uniform grid index over moving objects (entities).
+    An object is moved to other cells only when its rect crosses a cell border,
+    so keeping the index up to date costs a cell computation per moving object and step
+    """
+
+    def __init__(self, cell_size):
+        """
+        :param cell_size: width and height of one grid cell in pixels
+        """
+        self.cell_size = cell_size
+        self.cells = {}  # (column, row) -> set of objects
+        self.ranges = {}  # object -> cell range it is in
+        self.order = {}  # object -> insertion number, query results are sorted by it
+        self.inserted = 0
+
+    def __len__(self):
+        return len(self.ranges)
+
+    def __contains__(self, obj):
+        return obj in self.ranges
+
+    def insert(self, obj, rect):
+        """
+        :param obj: indexed object (hashable)
+        :param rect: the object's current collision rect
+        """
+        self.order[obj] = self.inserted
+        self.inserted += 1
+        self.move(obj, rect)
+
+    def move(self, obj, rect):
+        """
+        Updates the cells of an inserted object after its rect moved
+        """
+        new = cell_range(self.cell_size, rect.left, rect.top, rect.right, rect.bottom)
+        old = self.ranges.get(obj)
+        if new == old:
+            return
+        if old:
+            self._unlink(obj, old)
+        cells = self.cells
+        for col in range(new[0], new[2] + 1):
+            for row in range(new[1], new[3] + 1):
+                cell = cells.get((col, row))
+                if cell is None:
+                    cells[(col, row)] = {obj}
+                else:
+                    cell.add(obj)
+        self.ranges[obj] = new
+
+    def move_all(self, objects):
+        """
+        move() for many objects, with the common case (still in the same cells) checked inline
+        :param objects: iterable of (object, rect)
+        """
+        size = self.cell_size
+        ranges = self.ranges
+        for obj, rect in objects:
+            if ranges[obj] != (floor(rect.left / size), floor(rect.top / size),
+                               ceil(rect.right / size) - 1, ceil(rect.bottom / size) - 1):
+                self.move(obj, rect)
+
+    def remove(self, obj):
+        old = self.ranges.pop(obj, None)
+        if old:
+            self._unlink(obj, old)
+            del self.order[obj]
+
+    def _unlink(self, obj, cell_range):
+        cells = self.cells
+        for col in range(cell_range[0], cell_range[2] + 1):
+            for row in range(cell_range[1], cell_range[3] + 1):
+                cell = cells[(col, row)]
+                cell.discard(obj)
+                if not cell:
+                    del cells[(col, row)]
+
+    def query(self, rect):
+        """
+        :param rect: rect to search
+        :return: objects in the cells the rect touches (candidates, still to be tested), in insertion order
+        """
+        col_start, row_start, col_end, row_end = cell_range(self.cell_size, rect.left, rect.top,
+                                                            rect.right, rect.bottom)
+        cells = self.cells
+        found = set()
+        for col in range(col_start, col_end + 1):
+            for row in range(row_start, row_end + 1):
+                cell = cells.get((col, row))
+                if cell:
+                    found.update(cell)
+        return sorted(found, key=self.order.__getitem__)
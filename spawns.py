@@ -0,0 +1,97 @@
+from random import randint
+from timer import Timer
+
+
+class SpawnRegistry:
+    """
+    Spawn points of one kind of entity (enemies, hearts, coins).
+    Every spawned entity keeps the index of its spawn slot in `spawn_slot`, so freeing the slot
+    when the entity is killed or collected needs no search, and respawns are fired by the timer scheduler.
+    Suspended slots (chunk not loaded, see streaming.py) keep their state but have no entity in the game
+    """
+
+    def __init__(self, spawn, delay):
+        """
+        :param spawn: function(rect, data) creating the entity of a slot and returning it
+        :param delay: (min, max) respawn delay in whole seconds
+        """
+        self.spawn = spawn
+        self.delay = delay
+        self.rects = []  # slot -> spawn area
+        self.data = []  # slot -> extra spawn data (coin value) or None
+        self.spawned = bytearray()  # slot -> 1 if its entity is in the game (or would be if not suspended)
+        self.entities = {}  # slot -> its entity in the game
+        self.suspended = set()  # slots whose entities are not in the game until they are resumed
+        self.waiting = {}  # free slot -> its respawn timer
+        self.freed = []  # slots freed since the last update, their timers are not started yet
+
+    def __len__(self):
+        return len(self.rects)
+
+    def add(self, rect, data=None, suspended=False):
+        """
+        Adds a spawn slot and spawns its entity
+        :param rect: spawn area
+        :param data: extra data passed to the spawn function
+        :param suspended: add the slot suspended, its entity is spawned when the slot is resumed
+        :return: the spawned entity, None if suspended
+        """
+        self.rects.append(rect)
+        self.data.append(data)
+        self.spawned.append(0)
+        if suspended:
+            self.suspended.add(len(self.rects) - 1)
+        return self.spawn_slot(len(self.rects) - 1)
+
+    def spawn_slot(self, slot):
+        self.waiting.pop(slot, None)
+        self.spawned[slot] = 1
+        if slot in self.suspended:
+            return None  # spawned when the slot is resumed
+        entity = self.spawn(self.rects[slot], self.data[slot])
+        entity.spawn_slot = slot
+        self.entities[slot] = entity
+        return entity
+
+    def suspend(self, slot):
+        """
+        Takes the entity of a slot out of the game, a pending respawn still counts down
+        """
+        self.suspended.add(slot)
+        entity = self.entities.pop(slot, None)
+        if entity:
+            entity.kill()
+
+    def resume(self, slot):
+        """
+        Spawns the entity of a suspended slot again, unless it was killed/collected and waits for its respawn
+        """
+        self.suspended.discard(slot)
+        if self.spawned[slot] and slot not in self.entities:
+            self.spawn_slot(slot)
+
+    def release(self, entity):
+        """
+        Frees the spawn slot of a killed/collected entity, its respawn timer starts with the next update
+        :return: True if the entity came from a slot of this registry that was not free yet
+        """
+        slot = getattr(entity, 'spawn_slot', None)
+        if slot is None or not self.spawned[slot]:
+            return False
+        self.spawned[slot] = 0
+        self.entities.pop(slot, None)
+        self.freed.append(slot)
+        return True
+
+    def update(self):
+        """
+        Starts the respawn timers of newly freed slots, the timer scheduler respawns their entities
+        """
+        for slot in sorted(self.freed):
+            self.waiting[slot] = Timer(
+                duration=randint(*self.delay) * 1000,
+                func=lambda slot=slot: self.spawn_slot(slot),
+                repeat=False,
+                autostart=True
+            )
+        self.freed.clear()
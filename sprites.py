@@ -2,15 +2,20 @@ import pygame
 from settings import *
 from support import *
 from timer import Timer
+from profiler import profiler
 from random import randint
 import random
 
 
 class Sprite(pygame.sprite.Sprite):
+    render_layer = LAYER_MAIN  # AllSprites draws lower layers first
+    extra_images = False  # True if extra_entries adds images drawn with the sprite
+
     def __init__(self, pos, image, groups):
         super().__init__(groups)
         self.image = image
-        self.rect = self.image.get_frect(topleft=pos)
+        self.rect = pygame.FRect(pos, world_size(image))  # world units, whatever resolution the image has
+        self.previous_pos = self.rect.topleft  # position before the last simulation step (for interpolation)
         self.map_bounds = None
 
 
@@ -35,11 +40,15 @@ class AnimatedSprite(Sprite):
         self.frame_index += speed * dt
 
         self.image = self.animations['idle'][int(self.frame_index) % len(self.animations['idle'])]
-        self.image = pygame.transform.flip(self.image, self.flip, False)
+        if self.flip:
+            self.image = flip_frame(self.image)
 
 
 class Player(AnimatedSprite):
-    def __init__(self, pos, groups, collision_sprites, entities, animations):
+    render_layer = LAYER_PLAYER
+    extra_images = True  # the kick
+
+    def __init__(self, pos, groups, collision_grid, entities, animations):
         super().__init__(animations, pos, groups)
         self.flip = False  # player model flip flag
         self.attacking = False  # boolean flag if player is currently attacking
@@ -49,7 +58,7 @@ class Player(AnimatedSprite):
 
         # movement, collisions
         self.direction = pygame.Vector2()  # current direction
-        self.collision_sprites = collision_sprites  # collision spirtes such as terrain
+        self.collision_grid = collision_grid  # spatial grid of terrain collision rects
         self.entities = entities  # entites such as enemies or collectibles
         self.speed = SPEED  # current player speed
         self.gravity = GRAVITY  # gravity force
@@ -57,6 +66,7 @@ class Player(AnimatedSprite):
         self.max_health = 4  # player max hp
         self.health = self.max_health  # set current health at initializing at max health
         self.dead = False  # checks if player died
+        self.input_source = pygame.key.get_pressed  # replaced by scripted input in headless mode
         # self.inputs_on = True
         # self.can_collide = True
 
@@ -72,7 +82,7 @@ class Player(AnimatedSprite):
         """
         Player key input handling
         """
-        keys = pygame.key.get_pressed()
+        keys = self.input_source()
         if not self.attacking:
             # simple calculations of subraction for the direction vector
             self.direction.x = int(keys[pygame.K_RIGHT]) - int(keys[pygame.K_LEFT])
@@ -88,6 +98,23 @@ class Player(AnimatedSprite):
             self.attack_timer = len(self.animations['attack'])
             self.frame_index = 0
 
+    def extra_entries(self, pos):
+        """
+        :param pos: screen position the player is drawn at, in world units
+        :return: [(image, screen position in world units)] of the kick while attacking
+        """
+        if not self.attacking:
+            return ()
+        kick_img = flip_frame(self.animations['kick']) if self.flip else self.animations['kick']
+        kick_rect = pygame.Rect((0, 0), world_size(kick_img))
+        kick_rect.centery = self.attack_hitbox.centery - 15
+        if self.flip:
+            kick_rect.left = self.attack_hitbox.left
+        else:
+            kick_rect.right = self.attack_hitbox.right
+        # the kick moves with the interpolated player
+        return [(kick_img, ((kick_rect.x + pos[0]) - self.rect.x, (kick_rect.y + pos[1]) - self.rect.y))]
+
     def move(self, dt):
         """
         Movement and gravity handling
@@ -101,7 +128,7 @@ class Player(AnimatedSprite):
         # vertical
         self.on_floor = False
         self.direction.y += self.gravity * dt  # acceleration increases with every frame
-        self.hitbox.y += self.direction.y
+        self.hitbox.y += self.direction.y * dt * FRAMERATE  # direction.y is in pixels per 1/FRAMERATE s
         self.collision('vertical')
         # update sprite position to match hitbox
         self.rect.midbottom = self.hitbox.midbottom
@@ -115,21 +142,22 @@ class Player(AnimatedSprite):
         Handling terrain colisions with player
         :param direction: current direction
         """
-        # hitbox collisions with terrain
-        for sprite in self.collision_sprites:
-            if sprite.rect.colliderect(self.hitbox):
-                if direction == 'horizontal':
-                    if self.direction.x > 0:
-                        self.hitbox.right = sprite.rect.left
-                    if self.direction.x < 0:
-                        self.hitbox.left = sprite.rect.right
-                if direction == 'vertical':
-                    if self.direction.y > 0:
-                        self.hitbox.bottom = sprite.rect.top
-                        self.on_floor = True
-                    if self.direction.y < 0:
-                        self.hitbox.top = sprite.rect.bottom
-                    self.direction.y = 0
+        # hitbox collisions with terrain (only rects in nearby grid cells)
+        with profiler.scope('terrain collision'):
+            for rect in self.collision_grid.query(self.hitbox):
+                if rect.colliderect(self.hitbox):
+                    if direction == 'horizontal':
+                        if self.direction.x > 0:
+                            self.hitbox.right = rect.left
+                        if self.direction.x < 0:
+                            self.hitbox.left = rect.right
+                    if direction == 'vertical':
+                        if self.direction.y > 0:
+                            self.hitbox.bottom = rect.top
+                            self.on_floor = True
+                        if self.direction.y < 0:
+                            self.hitbox.top = rect.bottom
+                        self.direction.y = 0
 
         # setting map boundaries to not let the player fall off
         if self.map_bounds:
@@ -184,8 +212,9 @@ class Player(AnimatedSprite):
             self.frame_index += speed * dt
 
         self.image = self.animations[self.state][int(self.frame_index) % len(self.animations[self.state])]
-        # animation frames flip in case of flipping player
-        self.image = pygame.transform.flip(self.image, self.flip, False)
+        # animation frames flip in case of flipping player (flipped frames are cached)
+        if self.flip:
+            self.image = flip_frame(self.image)
 
         if self.flip:
             self.attack_hitbox.midright = self.hitbox.midleft
@@ -199,16 +228,16 @@ class Player(AnimatedSprite):
         """
         self.kill_player()
         # self.death_timer.update()
-        self.attack_cd.update()
         self.input()
         self.move(dt)
         self.animate(dt)
 
 
 class Enemy(AnimatedSprite):
-    def __init__(self, rect, groups, collision_sprites, entities, animations, create_projectile):
+    def __init__(self, rect, groups, collision_grid, entities, animations, create_projectile, player=None):
         super().__init__(animations, rect.topleft, groups)
         self.create_projectile = create_projectile  # calling creating projectile if conditions met
+        self.player = player  # player to detect and attack
 
         # animations speed for each state
         self.animation_speeds = {
@@ -232,7 +261,7 @@ class Enemy(AnimatedSprite):
 
         self.direction = pygame.Vector2()  # direction vector
         self.direction.x = random.choice([-1, 1])  # random direction when spawning in
-        self.collision_sprites = collision_sprites  # groups passed in
+        self.collision_grid = collision_grid  # terrain grid and groups passed in
         self.entities = entities
         self.speed = randint(SPEED - 200, SPEED) * 0.4  # random speed for every instance of an enemy
         self.gravity = GRAVITY  # gravity from settings
@@ -280,7 +309,7 @@ class Enemy(AnimatedSprite):
         # Vertical movement (gravity)
         self.on_floor = False
         self.direction.y += self.gravity * dt
-        self.hitbox.y += self.direction.y
+        self.hitbox.y += self.direction.y * dt * FRAMERATE
         self.collision('vertical')
 
         # Update sprite position
@@ -294,23 +323,24 @@ class Enemy(AnimatedSprite):
         Collision handling
         :param direction: direction vector passed in
         """
-        # terrain colision handling
-        for sprite in self.collision_sprites:
-            if sprite.rect.colliderect(self.hitbox):
-                if direction == 'horizontal':
-                    if self.direction.x > 0:
-                        self.hitbox.right = sprite.rect.left
-                        self.flip = False
-                    if self.direction.x < 0:
-                        self.hitbox.left = sprite.rect.right
-                        self.flip = True
-                if direction == 'vertical':
-                    if self.direction.y > 0:
-                        self.hitbox.bottom = sprite.rect.top
-                        self.on_floor = True
-                    if self.direction.y < 0:
-                        self.hitbox.top = sprite.rect.bottom
-                    self.direction.y = 0
+        # terrain colision handling (only rects in nearby grid cells)
+        with profiler.scope('terrain collision'):
+            for rect in self.collision_grid.query(self.hitbox):
+                if rect.colliderect(self.hitbox):
+                    if direction == 'horizontal':
+                        if self.direction.x > 0:
+                            self.hitbox.right = rect.left
+                            self.flip = False
+                        if self.direction.x < 0:
+                            self.hitbox.left = rect.right
+                            self.flip = True
+                    if direction == 'vertical':
+                        if self.direction.y > 0:
+                            self.hitbox.bottom = rect.top
+                            self.on_floor = True
+                        if self.direction.y < 0:
+                            self.hitbox.top = rect.bottom
+                        self.direction.y = 0
         # map bounds handling to not let the enemy fall out
         if self.map_bounds:
             if direction == 'horizontal':
@@ -329,30 +359,29 @@ class Enemy(AnimatedSprite):
         """
         Player detection logic handling
         """
-        for entity in self.entities:
-            if isinstance(entity, Player):
-                # Calculate distances
-                x_distance = entity.hitbox.centerx - self.hitbox.centerx
-                y_distance = abs(entity.hitbox.centery - self.hitbox.centery)
-
-                y_threshold = 50 * SCALE  # distance for player to be spotted
-
-                # if x distance of the player smaller than detection range, detect player
-                if abs(x_distance) <= self.detection_range and y_distance <= y_threshold:
-                    if not self.player_detected:  # if the flag is not set yet:
-                        if not hasattr(self,
-                                       'saved_direction'):  # save movement direction if player leave detection zone
-                            self.saved_direction = self.direction.x
-                        self.player_detected = True  # then set detection flag true
-                        if not self.attacking and not self.attack_cd.active:
-                            self.attack()  # start attack
-                            self.attack_cd.activate()  # cooldown
-                    self.flip = x_distance < 0  # flipping enemy model based on direction
-                else:  # if player not in detection range:
-                    if self.player_detected:
-                        self.player_detected = False  # set detection flag to false
-                        self.direction.x = getattr(self, 'saved_direction')
-                break
+        player = self.player
+        if player is not None:
+            # Calculate distances
+            x_distance = player.hitbox.centerx - self.hitbox.centerx
+            y_distance = abs(player.hitbox.centery - self.hitbox.centery)
+
+            y_threshold = 50 * SCALE  # distance for player to be spotted
+
+            # if x distance of the player smaller than detection range, detect player
+            if abs(x_distance) <= self.detection_range and y_distance <= y_threshold:
+                if not self.player_detected:  # if the flag is not set yet:
+                    if not hasattr(self,
+                                   'saved_direction'):  # save movement direction if player leave detection zone
+                        self.saved_direction = self.direction.x
+                    self.player_detected = True  # then set detection flag true
+                    if not self.attacking and not self.attack_cd.active:
+                        self.attack()  # start attack
+                        self.attack_cd.activate()  # cooldown
+                self.flip = x_distance < 0  # flipping enemy model based on direction
+            else:  # if player not in detection range:
+                if self.player_detected:
+                    self.player_detected = False  # set detection flag to false
+                    self.direction.x = getattr(self, 'saved_direction')
         # continue attacking after spotting and finishing first attack cycle
         if self.player_detected and not self.attacking and not self.attack_cd.active and not self.dead:
             self.attack()
@@ -402,10 +431,10 @@ class Enemy(AnimatedSprite):
             self.frame_index += speed * dt
 
         self.image = self.animations[self.state][int(self.frame_index) % len(self.animations[self.state])]
-        self.image = pygame.transform.flip(self.image, self.flip, False)
+        if self.flip:
+            self.image = flip_frame(self.image)
 
     def update(self, dt):
-        self.attack_cd.update()
         # print(self.state)
         self.player_detection()
         self.move(dt)
@@ -413,22 +442,44 @@ class Enemy(AnimatedSprite):
 
 
 class Projectile(AnimatedSprite):
-    def __init__(self, animation, pos, direction, groups):
+    def __init__(self, animation, pos, direction, groups, pool=None):
         super().__init__(animation, pos, groups)
         self.animation_speed = {
             'idle': 10,
         }
         self.direction = pygame.Vector2()
-        self.direction.x = direction
         self.speed = SPEED * 1.1  # projectile speed
-        self.flip = False
         self.damage = 1  # projectile damage
-        self.damaged_player = False
+        self.pool = pool  # pool the projectile goes back to when killed
 
         self.hitbox_offset = 10 * SCALE
         self.proj_hitbox = self.rect.inflate(-(self.rect.width - 18 * SCALE), -(self.rect.height - 18 * SCALE))
-        self.rect.center = self.proj_hitbox.center
-        self.kill_proj = Timer(1500, self.kill, autostart=True)  # deleting projectile after it flew given distance
+        self.kill_proj = Timer(1500, self.kill)  # deleting projectile after it flew given distance
+        self.reset(pos, direction)
+        if not pool:
+            self.kill_proj.activate()  # pooled projectiles start it when they are spawned
+
+    def reset(self, pos, direction):
+        """
+        Puts the projectile into its starting state, used for new and for reused (pooled) projectiles.
+        The lifetime timer is started by whoever puts the projectile into the game
+        :param pos: top left position of the projectile image
+        :param direction: -1 = flying left, 1 = flying right
+        """
+        self.frame_index = 0
+        self.image = self.animations['idle'][0]
+        self.rect.topleft = pos
+        self.direction.update(direction, 0)
+        self.flip = False
+        self.damaged_player = False
+
+        self.proj_hitbox.center = self.rect.center
+        self.previous_pos = self.rect.topleft
+
+    def kill(self):
+        super().kill()
+        if self.pool:
+            self.pool.release(self)
 
     def move(self, dt):
         self.rect.x += self.direction.x * self.speed * dt
@@ -444,7 +495,8 @@ class Projectile(AnimatedSprite):
             self.kill()
 
     def update(self, dt):
-        self.kill_proj.update()
+        if self.pool and self.pool.kinematics:
+            return  # moved together with the other pooled projectiles by ProjectileKinematics.step
         self.move(dt)
         self.animate(dt)
 
@@ -0,0 +1,110 @@
+from settings import *
+from spatial import cell_range
+
+
+class WorldStreamer:
+    """
+    Keeps only the part of the level around the player loaded. A chunk (CHUNK_SIZE world units) is loaded
+    when it gets within `load_distance` of the screen: its tiles are baked and the entities of its spawn
+    slots are spawned. It is unloaded when it gets further than `unload_distance`: the chunk surfaces
+    are released and its entities are suspended (killed, spawned again when the chunk is loaded again).
+    Unload distance is bigger than the load distance, so walking along a chunk border does not reload it
+    """
+
+    def __init__(self, layer, registries, load_distance=STREAM_DISTANCE, unload_distance=None, render=True,
+                 chunk_size=CHUNK_SIZE):
+        """
+        :param layer: static map layer (ChunkedLayer)
+        :param registries: spawn registries of the level, with their slots added suspended
+        :param load_distance: how far outside of the screen chunks are loaded, in pixels
+        :param unload_distance: how far outside of the screen chunks stay loaded, load_distance + one chunk if None
+        :param render: bake the chunk surfaces when loading (headless runs never draw them)
+        :param chunk_size: chunk size in world units, the same whatever the render scale of the layer chunks is
+        """
+        self.layer = layer
+        self.registries = registries
+        self.chunk_size = chunk_size
+        self.load_distance = load_distance
+        self.unload_distance = unload_distance if unload_distance is not None else load_distance + self.chunk_size
+        self.render = render
+
+        self.loaded = set()  # (column, row) of the loaded chunks
+        self.area = None  # chunk range loaded by the last update
+        self.slots = {}  # (column, row) -> [(registry, slot)] of the spawn slots in the chunk
+        for registry in registries:
+            for slot, rect in enumerate(registry.rects):
+                key = (int(rect.centerx // self.chunk_size), int(rect.centery // self.chunk_size))
+                self.slots.setdefault(key, []).append((registry, slot))
+
+    def chunk_range(self, pos, distance):
+        """
+        :param pos: center of the screen in world coordinates
+        :param distance: margin around the screen in pixels
+        :return: (first column, first row, last column, last row) of the chunks around the screen
+        """
+        x, y = pos
+        return cell_range(self.chunk_size, x - WINDOW_WIDTH / 2 - distance, y - WINDOW_HEIGHT / 2 - distance,
+                          x + WINDOW_WIDTH / 2 + distance, y + WINDOW_HEIGHT / 2 + distance)
+
+    def update(self, pos):
+        """
+        Loads the chunks that came close to the screen and unloads the ones far away,
+        does nothing while the player stays in the same chunk range
+        :param pos: center of the screen in world coordinates (the player)
+        """
+        area = self.chunk_range(pos, self.load_distance)
+        if area == self.area:
+            return
+        self.area = area
+
+        first_col, first_row, last_col, last_row = self.chunk_range(pos, self.unload_distance)
+        for key in sorted(self.loaded):
+            if not (first_col <= key[0] <= last_col and first_row <= key[1] <= last_row):
+                self.unload(key)
+        # layer chunks (also baked by drawing) outside of the kept area are released
+        size = self.chunk_size
+        kept = pygame.Rect(first_col * size, first_row * size,
+                           (last_col - first_col + 1) * size, (last_row - first_row + 1) * size)
+        layer_size = self.layer.chunk_size
+        for col, row in list(self.layer.chunks):
+            if not kept.colliderect((col * layer_size, row * layer_size, layer_size, layer_size)):
+                self.layer.release((col, row))
+
+        first_col, first_row, last_col, last_row = area
+        self.load([(col, row) for col in range(first_col, last_col + 1) for row in range(first_row, last_row + 1)
+                   if (col, row) not in self.loaded])
+        if self.render:
+            for key in self.layer.keys((first_col * size, first_row * size,
+                                        (last_col - first_col + 1) * size, (last_row - first_row + 1) * size)):
+                self.layer.bake(key)
+
+    def load(self, keys):
+        """
+        :param keys: (column, row) of the chunks to load
+        """
+        resumed = {registry: [] for registry in self.registries}
+        for key in keys:
+            self.loaded.add(key)
+            for registry, slot in self.slots.get(key, ()):
+                resumed[registry].append(slot)
+        # entities are spawned in slot order, the same order as without streaming
+        for registry, slots in resumed.items():
+            for slot in sorted(slots):
+                registry.resume(slot)
+
+    def unload(self, key):
+        self.loaded.discard(key)
+        for registry, slot in self.slots.get(key, ()):
+            registry.suspend(slot)
+
+    def stats(self):
+        """
+        :return: dict with the loaded chunks, baked chunk surfaces, their memory in bytes and the live entities
+        """
+        return {
+            'loaded': len(self.loaded),
+            'baked': len(self.layer.chunks),
+            'bytes': sum(chunk.get_width() * chunk.get_height() * chunk.get_bytesize()
+                         for chunk in self.layer.chunks.values()),
+            'entities': sum(len(registry.entities) for registry in self.registries)
+        }
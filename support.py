@@ -1,6 +1,134 @@
 from settings import *
 from os.path import join
+from weakref import WeakKeyDictionary
 import pygame
+from atlas import TextureAtlas
+
+# frame -> its horizontally flipped copy, so animations don't create a flipped surface every frame
+flipped_frames = WeakKeyDictionary()
+
+# world units per drawn pixel of the world images: 1 draws the world at the window resolution,
+# SCALE loads it at the native resolution of the pixel art (upscaled once per frame, see AllSprites)
+render_scale = 1
+world_sizes = WeakKeyDictionary()  # image loaded at a render scale above 1 -> its size in world units
+
+# frames and map tiles are packed into its pages, None gives every image its own surface
+texture_atlas = TextureAtlas() if TEXTURE_ATLAS else None
+
+# process-wide cache of loaded assets, keys are tuples: (kind, path or source key, parameters...)
+asset_cache = {}
+asset_keys = {}  # id of a cached surface -> its cache key, so derived assets are keyed on the file path
+cache_stats = {'hits': 0, 'misses': 0}
+
+
+def get_asset(key, load):
+    """
+    Returns an asset from the cache, loading it only on the first request.
+    Cached surfaces are shared, so they must not be drawn on
+    :param key: cache key tuple
+    :param load: function creating the asset if it is not cached yet
+    :return: cached asset
+    """
+    asset = asset_cache.get(key)
+    if asset is None:
+        cache_stats['misses'] += 1
+        asset = load()
+        add_asset(key, asset)
+    else:
+        cache_stats['hits'] += 1
+    return asset
+
+
+def add_asset(key, asset):
+    """
+    Puts an already loaded asset into the cache (used when assets come from the baked asset pack)
+    :param key: cache key tuple
+    :param asset: asset to store
+    """
+    asset_cache[key] = asset
+    if isinstance(asset, pygame.Surface):
+        asset_keys[id(asset)] = key
+
+
+def asset_key(asset):
+    """
+    :return: cache key of a cached asset, or the asset itself if it wasn't loaded through the cache
+    """
+    return asset_keys.get(id(asset), asset)
+
+
+def invalidate_assets(path=None):
+    """
+    Removes assets from the cache, so they are loaded from the disk again on the next request.
+    Texture atlas areas of the removed frames and tiles are given back to the atlas
+    :param path: only remove assets loaded from (or derived from) this file, everything if None
+    """
+    if path is None:
+        asset_cache.clear()
+        asset_keys.clear()
+        if texture_atlas:
+            texture_atlas.clear()
+        return
+    released = {}
+    for key in [key for key in asset_cache if path in str(key)]:
+        asset = asset_cache.pop(key)
+        asset_keys.pop(id(asset), None)
+        for surface in asset_surfaces(asset):
+            released[id(surface)] = surface
+            if surface in flipped_frames:
+                released[id(flipped_frames[surface])] = flipped_frames[surface]
+    if texture_atlas:
+        for surface in released.values():
+            if texture_atlas.owns(surface):
+                texture_atlas.release(surface)
+
+
+def asset_surfaces(asset):
+    """
+    :param asset: cached asset
+    :return: surfaces of an image, a frame list or a parsed map (its tiles)
+    """
+    if isinstance(asset, pygame.Surface):
+        return [asset]
+    if isinstance(asset, list):
+        return [frame for frame in asset if isinstance(frame, pygame.Surface)]
+    if isinstance(asset, dict):
+        return [image for image, _ in asset.get('tiles', ())]
+    return []
+
+
+def set_render_scale(scale=1):
+    """
+    Changes the resolution world images are loaded at, assets loaded before keep theirs
+    :param scale: world units per drawn pixel
+    """
+    global render_scale
+    render_scale = scale
+
+
+def use_texture_atlas(enabled=True):
+    """
+    Switches packing of the frames and map tiles loaded from now on into a texture atlas
+    """
+    global texture_atlas
+    texture_atlas = TextureAtlas() if enabled else None
+
+
+def world_size(image):
+    """
+    :return: size of a world image in world units (sprite rects are that big whatever the render scale)
+    """
+    size = world_sizes.get(image)
+    if size is None:
+        return image.get_width() * render_scale, image.get_height() * render_scale
+    return size
+
+
+def asset_cache_info():
+    """
+    :return: dict with cache hits, misses and number of cached assets
+    """
+    return {**cache_stats, 'entries': len(asset_cache)}
 
 
 def import_image(*path, format='png', alpha=True):
@@ -12,7 +140,104 @@ def import_image(*path, format='png', alpha=True):
     :return: returns a loaded in picture with a conversion of the transparent pixels
     """
     full_path = join(*path) + f'.{format}'
-    return pygame.image.load(full_path).convert_alpha() if alpha else pygame.image.load(full_path).convert()
+    return get_asset(('image', full_path, alpha),
+                     lambda: pygame.image.load(full_path).convert_alpha() if alpha
+                     else pygame.image.load(full_path).convert())
+
+
+def scale_image(image, size):
+    """
+    Cached pygame.transform.scale
+    :param image: source image
+    :param size: new (width, height)
+    :return: scaled image
+    """
+    return get_asset(('scaled', asset_key(image), tuple(size)), lambda: pygame.transform.scale(image, size))
+
+
+def scale_world(image, size):
+    """
+    Cached scaling of a world image (background, kick) to a size in world units,
+    at a render scale above 1 the image is that many times smaller
+    :param image: source image
+    :param size: (width, height) in world units
+    :return: scaled image
+    """
+    if render_scale == 1:
+        return scale_image(image, size)
+    scaled = scale_image(image, (max(1, round(size[0] / render_scale)), max(1, round(size[1] / render_scale))))
+    world_sizes[scaled] = tuple(size)
+    return scaled
+
+
+class MapObject:
+    def __init__(self, name, x, y, width, height):
+        """
+        Plain copy of a Tiled map object, independent of pytmx
+        :param name: object name (Player, Enemy, Health, Objective)
+        :param x: x position in map pixels (unscaled)
+        :param y: y position in map pixels (unscaled)
+        :param width: width in map pixels (unscaled)
+        :param height: height in map pixels (unscaled)
+        """
+        self.name = name
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+
+def parse_map(full_path):
+    """
+    Loads a Tiled map and keeps only what the game needs
+    :param full_path: path of the .tmx file
+    :return: dict with map size in pixels (scaled), tiles as (scaled image, position) in drawing order
+        (images at the render scale, positions in world units),
+        solid tile coordinates of the 'Main' layer and the objects of the 'Entities' layer
+    """
+    tmx_map = load_pygame(full_path)
+    scaled_images = {}  # the same tile image is scaled only once
+    factor = SCALE / render_scale  # drawn pixels per map pixel
+
+    def scaled(image, size):
+        if id(image) not in scaled_images:
+            scaled_images[id(image)] = (texture_atlas.scale(image, size) if texture_atlas
+                                        else pygame.transform.scale(image, size))
+        return scaled_images[id(image)]
+
+    tiles = []
+    solid = []
+    # tiles with collisions
+    for x, y, image in tmx_map.get_layer_by_name('Main').tiles():
+        tiles.append((scaled(image, (int(TILE_SIZE * factor), int(TILE_SIZE * factor))),
+                      (x * TILE_SIZE * SCALE, y * TILE_SIZE * SCALE)))
+        solid.append((x, y))
+    # decorative assets without collisions, aligned to the bottom of their tile
+    for x, y, image in tmx_map.get_layer_by_name('Decorations').tiles():
+        scaled_image = scaled(image, (int(image.get_width() * factor), int(image.get_height() * factor)))
+        pixel_x = x * TILE_SIZE * SCALE
+        pixel_y = (y * TILE_SIZE * SCALE) - scaled_image.get_height() * render_scale + TILE_SIZE * SCALE
+        tiles.append((scaled_image, (pixel_x, pixel_y)))
+
+    return {
+        'width': tmx_map.width * tmx_map.tilewidth * SCALE,
+        'height': tmx_map.height * tmx_map.tileheight * SCALE,
+        'tiles': tiles,
+        'solid': solid,
+        'entities': [MapObject(obj.name, obj.x, obj.y, obj.width, obj.height)
+                     for obj in tmx_map.get_layer_by_name('Entities')]
+    }
+
+
+def import_map(*path):
+    """
+    Cached loading of a Tiled map
+    :param path: system path for the .tmx file
+    :return: parsed map data (see parse_map)
+    """
+    full_path = join(*path)
+    key = ('map', full_path) if render_scale == 1 else ('map', full_path, render_scale)
+    return get_asset(key, lambda: parse_map(full_path))
 
 
 class SpriteSheet:
@@ -31,15 +256,58 @@ class SpriteSheet:
         self.scale = scale
 
     def load_all_frames(self, count):
-        return [self.get_frame(i) for i in range(count)]
+        """
+        Splits the sheet into frames and prepares flipped (facing left) versions of them up front
+        :param count: number of frames in the sheet
+        :return: list of frames facing right
+        """
+        frames = [self.get_frame(i) for i in range(count)]
+        for frame in frames:
+            flip_frame(frame)
+        return frames
 
     def get_frame(self, index):
-        frame = pygame.Surface((self.width, self.height),
-                               pygame.SRCALPHA)  # creates a surface without transparent pixels
-        frame.blit(self.sheet, (0, 0), (index * self.width, 0, self.width, self.height))
         size = (int(self.width * SCALE * self.scale), int(self.height * SCALE * self.scale))
-        return pygame.transform.scale(frame, size)
+        world = size
+        if render_scale != 1:
+            # smaller by the render scale, the sprite rects keep the size in world units
+            size = (max(1, round(size[0] / render_scale)), max(1, round(size[1] / render_scale)))
+        if texture_atlas:
+            # scaled from a view of the sheet straight into the atlas, no copies of the frame
+            frame = texture_atlas.scale(self.sheet.subsurface((index * self.width, 0, self.width, self.height)), size)
+        else:
+            frame = pygame.Surface((self.width, self.height),
+                                   pygame.SRCALPHA)  # creates a surface without transparent pixels
+            frame.blit(self.sheet, (0, 0), (index * self.width, 0, self.width, self.height))
+            frame = pygame.transform.scale(frame, size)
+        if render_scale != 1:
+            world_sizes[frame] = world
+        return frame
+
+
+def flip_frame(frame):
+    """
+    Returns horizontally flipped version of the frame, flipping it only the first time
+    :param frame: animation frame
+    :return: cached flipped frame
+    """
+    flipped = flipped_frames.get(frame)
+    if flipped is None:
+        flipped = pygame.transform.flip(frame, True, False)
+        if texture_atlas and texture_atlas.owns(frame):
+            flipped = texture_atlas.insert(flipped)  # next to the frames facing right
+        flipped_frames[frame] = flipped
+        if frame in world_sizes:
+            world_sizes[flipped] = world_sizes[frame]
+    return flipped
 
 
 def load_frames(sheet, count, width, height, scale=1):
-    return SpriteSheet(sheet, width, height, scale).load_all_frames(count)
+    """
+    Cached splitting of a spritesheet into frames
+    :return: list of frames
+    """
+    key = ('frames', asset_key(sheet), (width, height), count, scale)
+    if render_scale != 1:
+        key += (render_scale,)
+    return get_asset(key, lambda: SpriteSheet(sheet, width, height, scale).load_all_frames(count))
@@ -1,7 +1,67 @@
+import heapq
 import pygame.time
 from settings import *
 
 
+# source of the current time in ms, headless runs replace it with the simulated time
+clock = pygame.time.get_ticks
+
+
+def set_clock(func=None):
+    """
+    Changes the time source of all timers
+    :param func: function returning the current time in ms, None for pygame.time.get_ticks
+    """
+    global clock
+    clock = func or pygame.time.get_ticks
+
+
+class Scheduler:
+    """
+    Fires the active timers when they run out. Timers wait in a heap ordered by the time they end,
+    so an update only looks at the timers that expire instead of polling every timer in the game
+    """
+
+    def __init__(self):
+        self.heap = []  # (end time, order, timer, timer activation)
+        self.order = 0  # keeps timers ending at the same time in the order they were started
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, timer):
+        heapq.heappush(self.heap, (timer.start_time + timer.duration, self.order, timer, timer.activation))
+        self.order += 1
+
+    def clear(self):
+        self.heap.clear()
+
+    def update(self):
+        """
+        Fires every timer that ran out, called once per simulation step. A timer fires at most once per update,
+        even a repeating one that is due again right away (duration 0), like when every timer was polled
+        """
+        heap = self.heap
+        now = clock()
+        due = []
+        while heap:
+            _, _, timer, activation = heap[0]
+            if activation != timer.activation:  # deactivated or started again since it was scheduled
+                heapq.heappop(heap)
+            elif now - timer.start_time >= timer.duration:
+                heapq.heappop(heap)
+                due.append((timer, activation))
+            else:
+                break
+        for timer, activation in due:
+            if activation == timer.activation:  # not stopped or restarted by a timer fired before it
+                timer.expire()
+
+
+# shared scheduler of all timers (Game.update_world updates it every simulation step)
+scheduler = Scheduler()
+
+
 # Zastepuje eventy pygame
 class Timer:
     def __init__(self, duration, func=None, repeat=None, autostart=False):
@@ -10,6 +70,7 @@ class Timer:
         self.active = False
         self.func = func
         self.repeat = repeat
+        self.activation = 0  # counts activations/deactivations, older scheduler entries are ignored
 
         if autostart:
             self.activate()
@@ -19,16 +80,29 @@ class Timer:
 
     def activate(self):
         self.active = True
-        self.start_time = pygame.time.get_ticks()
+        self.start_time = clock()
+        self.activation += 1
+        scheduler.schedule(self)
 
     def deactivate(self):
         self.active = False
         self.start_time = 0
+        self.activation += 1
         if self.repeat:
             self.activate()
 
+    def cancel(self):
+        # stops the timer for good, deactivate() starts a repeating timer again
+        self.active = False
+        self.start_time = 0
+        self.activation += 1
+
+    def expire(self):
+        if self.func and self.start_time != 0:
+            self.func()
+        self.deactivate()
+
     def update(self):
-        if pygame.time.get_ticks() - self.start_time >= self.duration:
-            if self.func and self.start_time != 0:
-                self.func()
-            self.deactivate()
+        # the scheduler fires timers on its own, polling a timer still works like it used to
+        if clock() - self.start_time >= self.duration:
+            self.expire()